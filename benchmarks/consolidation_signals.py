@@ -0,0 +1,124 @@
+import argparse
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.waves_regression import get_candles, timed
+from ea.strategies.indicators.consolidation import Consolidation
+from ea.strategies.indicators.waves import Waves
+
+
+def legacy_open_position_signals(dataframe: pd.DataFrame) -> pd.DataFrame:
+    # Consolidation.get_open_position_signals as it used to be ('nan' literal so it runs on numpy 2 as well)
+    dataframe['recent_consolidation_end'] = dataframe['consolidation_id'] \
+        .apply(lambda x: x.value / 1000000000 - (2 * 60 * 60) if x.value > 0 else 0) \
+        .expanding(1) \
+        .max()
+
+    with_last_consolidation_end = dataframe[dataframe['recent_consolidation_end'] > 0].copy()
+    with_last_consolidation_end['recent_consolidation_end'] = with_last_consolidation_end['recent_consolidation_end'] \
+        .apply(lambda x: datetime.fromtimestamp(int(x)))
+
+    aggregated = with_last_consolidation_end \
+        .groupby(['recent_consolidation_end'])[['recent_consolidation_end', 'consolidation_min', 'consolidation_max']] \
+        .agg(recent_consolidation_end=('recent_consolidation_end', 'max'),
+             recent_consolidation_min=('consolidation_min', 'max'),
+             recent_consolidation_max=('consolidation_max', 'max')
+             ) \
+        .reset_index(drop=True)
+
+    joined = pd.merge(
+        with_last_consolidation_end, aggregated,
+        how='left',
+        on=['recent_consolidation_end']
+    )
+
+    joined['recent_consolidation_mid'] = \
+        joined['recent_consolidation_max'] - (joined['recent_consolidation_max'] - joined['recent_consolidation_min']) / 2
+
+    numpy_now = np.datetime64('now')
+
+    joined['consolidation_break_at'] = np.where(
+        joined['date_time'] > joined['recent_consolidation_end'],
+        np.where(
+            (joined['close'] > joined['recent_consolidation_max']) | (joined['close'] < joined['recent_consolidation_min']),
+            joined['date_time'],
+            numpy_now
+        ),
+        numpy_now
+    )
+
+    joined['position_side'] = np.where(
+        joined['date_time'] > joined['recent_consolidation_end'],
+        np.where(
+            joined['close'] > joined['recent_consolidation_max'],
+            'bullish',
+            np.where(
+                joined['close'] < joined['recent_consolidation_min'],
+                'bearish',
+                'nan'
+            )
+        ),
+        'nan'
+    )
+
+    consolidation_break_at = joined \
+        .groupby(['recent_consolidation_end']) \
+        .agg(open_position_at=pd.NamedAgg('consolidation_break_at', 'min')) \
+        .reset_index(drop=True)
+
+    with_open_position_signals = pd.merge(
+        joined, consolidation_break_at,
+        how='left',
+        left_on='date_time',
+        right_on='open_position_at'
+    )
+
+    return with_open_position_signals
+
+
+def without_now(dataframe: pd.DataFrame, last_candle_at) -> pd.DataFrame:
+    # candles which did not break get the wall clock time, it differs between the runs
+    local_df = dataframe.copy()
+    for column in ['consolidation_break_at', 'open_position_at']:
+        local_df[column] = local_df[column].astype('datetime64[ns]').where(local_df[column] <= last_candle_at)
+
+    return local_df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--candles_count', type=int, default=20000)
+    parser.add_argument('-d', '--distance', type=float, default=0.0005)
+    parser.add_argument('-r', '--repeat', type=int, default=20)
+
+    args = parser.parse_args()
+
+    # the legacy code shifts consolidation ids by a hard-coded 2 hours and turns them back in local time,
+    # a fixed UTC+2 zone cancels that out so both results can be compared
+    os.environ['TZ'] = 'Etc/GMT-2'
+    time.tzset()
+
+    candles_df = get_candles(args.candles_count)
+    waves_df = Waves(dict(distance=args.distance)).analyze(candles_df)
+    consolidations_df = Consolidation(dict()).get_consolidations(waves_df, 10, 0.5, 3)
+
+    legacy, legacy_time = timed(legacy_open_position_signals, consolidations_df.copy())
+    vectorized, _ = timed(Consolidation.get_open_position_signals, consolidations_df)
+    vectorized_time = min(timed(Consolidation.get_open_position_signals, consolidations_df)[1] for _ in range(args.repeat))
+
+    last_candle_at = candles_df['date_time'].iloc[-1]
+    legacy_df = without_now(legacy, last_candle_at)
+    vectorized_df = without_now(vectorized, last_candle_at)
+    matching = legacy_df.drop(columns='position_side').equals(vectorized_df.drop(columns='position_side')) \
+        and (legacy_df['position_side'].astype(str) == vectorized_df['position_side'].astype(str)).all()
+
+    thousands = args.candles_count / 1000
+    print(f'candles: {args.candles_count}, signals rows: {len(vectorized)}')
+    print(f'legacy get_open_position_signals: {legacy_time:.3f}s ({1000 * legacy_time / thousands:.3f}ms per 1000 candles)')
+    print(f'vectorized:                       {vectorized_time:.4f}s ({1000 * vectorized_time / thousands:.3f}ms per 1000 candles, '
+          f'{legacy_time / vectorized_time:.0f}x)')
+    print(f'identical signals:                {matching}')
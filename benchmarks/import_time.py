@@ -0,0 +1,75 @@
+import argparse
+import subprocess
+import sys
+
+RUNNERS = ['ea.consolidation_runner', 'ea.trend_follower_runner', 'ea.engulfing_runner', 'ea.candles_long_shadows_runner']
+# best of 5 runs with warm bytecode, before and after plotly, scipy and scikit-learn were left out of the start-up;
+# the indicator modules stand for the runners, which could not be imported without xtbwrapper
+RECORDED_MS = {
+    'ea.strategies.indicators.trend_follower': (1253, 356),
+    'ea.strategies.indicators.candles.long_shadow': (1331, 381),
+    'ea.strategies.indicators.waves': (455, 378),
+    'ea.strategies.indicators.consolidation': (369, 383),
+}
+# pandas and numpy take most of the recorded times, a module over it pulls in a heavy package again
+BUDGET_MS = 600
+
+
+def get_import_times(module: str):
+    # cumulative microseconds per imported module as reported by python -X importtime, nested ones are indented
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], capture_output=True, text=True)
+
+    import_times = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or line.endswith('imported package'):
+            continue
+        _, cumulative, name = line.split('|')
+        import_times[name.strip()] = int(cumulative)
+
+    error = completed.stderr.strip().splitlines()[-1] if completed.returncode != 0 else None
+
+    return import_times, error
+
+
+def get_best_import_times(module: str, repeat: int):
+    # the fastest of the runs, the others are disturbed by the file system cache
+    runs = [get_import_times(module) for _ in range(repeat)]
+
+    return min(runs, key=lambda run: run[0].get(module, 0))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-m', '--modules', type=str, nargs='+', default=RUNNERS + list(RECORDED_MS))
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('-t', '--top', type=int, default=8)
+    parser.add_argument('-b', '--budget_ms', type=float, default=BUDGET_MS)
+
+    args = parser.parse_args()
+
+    over_budget = []
+    for module in args.modules:
+        import_times, error = get_best_import_times(module, args.repeat)
+        if error is not None:
+            print(f'{module}: import failed - {error}')
+            over_budget.append(module)
+            continue
+
+        total_ms = import_times[module] / 1000
+        recorded = f' (recorded {RECORDED_MS[module][0]}ms -> {RECORDED_MS[module][1]}ms)' if module in RECORDED_MS else ''
+        print(f'{module}: {total_ms:.1f}ms{recorded}')
+        # heaviest top level packages, wherever they were first imported
+        packages = sorted(
+            ((name, cumulative) for name, cumulative in import_times.items() if '.' not in name and name != module.split('.')[0]),
+            key=lambda package: package[1],
+            reverse=True
+        )
+        for name, cumulative in packages[:args.top]:
+            print(f'    {name:<24}{cumulative / 1000:>8.1f}ms')
+
+        if args.budget_ms is not None and total_ms > args.budget_ms:
+            over_budget.append(module)
+
+    if args.budget_ms is not None:
+        print(f'budget {args.budget_ms:.0f}ms exceeded by: {", ".join(over_budget)}' if over_budget else f'all within {args.budget_ms:.0f}ms')
+        sys.exit(1 if over_budget else 0)
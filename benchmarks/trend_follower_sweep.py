@@ -0,0 +1,41 @@
+import argparse
+from itertools import product
+
+import pandas as pd
+
+from benchmarks.waves_regression import get_candles, timed
+from ea.strategies.indicators.trend_follower import TrendFollower
+
+
+def separate_analyses(candles_df, extreme_candles_ranges: list, beta_extreme_counts: list, rolling_windows: list) -> dict:
+    return {
+        (extreme_candles_range, beta_extreme_count, rolling_window): TrendFollower(dict(
+            extreme_candles_range=extreme_candles_range,
+            beta_extreme_count=beta_extreme_count,
+            rolling_window=rolling_window
+        )).analyze(candles_df)
+        for extreme_candles_range, beta_extreme_count, rolling_window
+        in product(extreme_candles_ranges, beta_extreme_counts, rolling_windows)
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--candles_count', type=int, default=20000)
+    parser.add_argument('-ecr', '--extreme_candles_ranges', type=int, nargs='+', default=[5, 10, 20])
+    parser.add_argument('-bec', '--beta_extreme_counts', type=int, nargs='+', default=[3, 4, 5, 6])
+    parser.add_argument('-rw', '--rolling_windows', type=int, nargs='+', default=[10, 20, 50])
+
+    args = parser.parse_args()
+
+    candles_df = get_candles(args.candles_count)
+    parameters = (args.extreme_candles_ranges, args.beta_extreme_counts, args.rolling_windows)
+
+    separate, separate_time = timed(separate_analyses, candles_df, *parameters)
+    sweep, sweep_time = timed(TrendFollower(dict()).analyze_sweep, candles_df, *parameters)
+    matching = sweep.equals(pd.concat(separate, names=sweep.index.names[:-1]))
+
+    print(f'candles: {args.candles_count}, parameter sets: {len(separate)}')
+    print(f'separate analyze runs: {separate_time:.3f}s')
+    print(f'analyze_sweep:         {sweep_time:.3f}s ({separate_time / sweep_time:.1f}x)')
+    print(f'identical results:     {matching}')
@@ -0,0 +1,87 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from ea.strategies.indicators.regression import RunningRegression
+from ea.strategies.indicators.waves import Waves
+
+
+def get_candles(candles_count: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    close = 1.1 + np.cumsum(rng.normal(0.0, 0.0003, candles_count))
+    open = np.r_[close[0], close[:-1]]
+    high = np.maximum(open, close) + np.abs(rng.normal(0.0, 0.0002, candles_count))
+    low = np.minimum(open, close) - np.abs(rng.normal(0.0, 0.0002, candles_count))
+
+    return pd.DataFrame(dict(
+        date_time=pd.date_range('2023-01-02', periods=candles_count, freq='min'),
+        open=open.round(5),
+        close=close.round(5),
+        high=high.round(5),
+        low=low.round(5),
+        volume=rng.integers(1, 100, candles_count).astype(float)
+    ))
+
+
+def legacy_betas(waves: Waves, values: list, wave_length: int) -> list:
+    # per candle np.arange + np.array over the whole wave, as get_waves used to do
+    betas = []
+    regression_elements = []
+    for idx, value in enumerate(values):
+        if idx % wave_length == 0:
+            regression_elements = []
+        regression_elements.append(value)
+        regression_elements_count = len(regression_elements)
+        betas.append(waves.get_beta(
+            x=np.arange(1, (regression_elements_count + 1)),
+            y=np.array(regression_elements)
+        )[1])
+
+    return betas
+
+
+def running_betas(values: list, wave_length: int) -> list:
+    betas = []
+    regression = RunningRegression()
+    for idx, value in enumerate(values):
+        if idx % wave_length == 0:
+            regression.reset(value)
+        else:
+            regression.append(value)
+        betas.append(regression.get_beta())
+
+    return betas
+
+
+def timed(func, *args):
+    started_at = time.perf_counter()
+    result = func(*args)
+
+    return result, time.perf_counter() - started_at
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--candles_count', type=int, default=100000)
+    parser.add_argument('-wl', '--wave_length', type=int, default=2000)
+    parser.add_argument('-d', '--distance', type=float, default=0.002)
+
+    args = parser.parse_args()
+
+    candles_df = get_candles(args.candles_count)
+    medium_values = (candles_df['high'] - (candles_df['high'] - candles_df['low']) / 2).tolist()
+
+    waves = Waves(dict(distance=args.distance))
+    legacy, legacy_time = timed(legacy_betas, waves, medium_values, args.wave_length)
+    running, running_time = timed(running_betas, medium_values, args.wave_length)
+    max_difference = np.max(np.abs(np.array(legacy) - np.array(running)))
+
+    print(f'candles: {args.candles_count}, wave length: {args.wave_length}')
+    print(f'legacy get_beta per candle: {legacy_time:.3f}s')
+    print(f'running sums:               {running_time:.3f}s ({legacy_time / running_time:.0f}x)')
+    print(f'max beta difference:        {max_difference:.3e}')
+
+    _, waves_time = timed(waves.get_waves, candles_df, args.distance)
+    print(f'Waves.get_waves on full history: {waves_time:.3f}s')
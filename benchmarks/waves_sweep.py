@@ -0,0 +1,33 @@
+import argparse
+
+import numpy as np
+
+from benchmarks.waves_regression import get_candles, timed
+from ea.strategies.indicators.waves import Waves
+
+
+def separate_passes(waves: Waves, candles_df, distances: list) -> dict:
+    return {distance: waves.get_waves(candles_df, distance) for distance in distances}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--candles_count', type=int, default=100000)
+    parser.add_argument('-dmin', '--distance_min', type=float, default=0.0005)
+    parser.add_argument('-dmax', '--distance_max', type=float, default=0.005)
+    parser.add_argument('-dc', '--distances_count', type=int, default=20)
+
+    args = parser.parse_args()
+
+    candles_df = get_candles(args.candles_count)
+    distances = np.linspace(args.distance_min, args.distance_max, args.distances_count).round(6).tolist()
+
+    waves = Waves(dict())
+    separate, separate_time = timed(separate_passes, waves, candles_df, distances)
+    sweep, sweep_time = timed(waves.get_waves_sweep, candles_df, distances)
+    matching = all(sweep[distance].equals(separate[distance]) for distance in distances)
+
+    print(f'candles: {args.candles_count}, distances: {len(distances)}')
+    print(f'separate get_waves passes: {separate_time:.3f}s')
+    print(f'get_waves_sweep:           {sweep_time:.3f}s ({separate_time / sweep_time:.1f}x)')
+    print(f'identical waves:           {matching}')
@@ -0,0 +1,170 @@
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+
+import numpy as np
+import pendulum
+from xtb.wrapper.xtb_client import APIClient, loginCommand
+
+from ea.misc.logger import logger
+from ea.trading.candle_store import CandleStore
+from ea.trading.exceptions import CommandStatusException
+from ea.trading.expert_advisor import ExpertAdvisor
+from ea.trading.rate_limiter import RateLimiter
+
+
+@dataclass
+class BackfillRunnerSettings:
+    user_id: str
+    password: str
+    symbols: list[str]
+    period: int
+    start: datetime
+    end: datetime
+    candle_store_dir: str
+    # range of a single getChartRangeRequest
+    chunk_days: int
+    # concurrent connections, each one sends its requests one after another
+    workers: int
+    # minimal time between any two requests
+    request_interval: float
+    # attempts of a chunk before it is given up
+    chunk_retries: int
+
+
+class BackfillRunner:
+    def __init__(self, settings: BackfillRunnerSettings):
+        self._settings = settings
+        self._rate_limiter = RateLimiter(settings.request_interval)
+        self._local = threading.local()
+        self._clients = []
+        self._clients_lock = threading.Lock()
+
+    def get_client(self) -> APIClient:
+        # the connection of the worker thread, logged in on its first request
+        if not hasattr(self._local, 'client'):
+            client = APIClient()
+            login_response = client.execute(loginCommand(userId=self._settings.user_id, password=self._settings.password))
+            if not login_response['status']:
+                raise CommandStatusException('Login failed. Error code: {0}'.format(login_response['errorCode']))
+
+            with self._clients_lock:
+                self._clients.append(client)
+            self._local.client = client
+
+        return self._local.client
+
+    def get_chunks(self) -> list[tuple[int, int]]:
+        start = int(self._settings.start.timestamp() * 1000)
+        end = int(self._settings.end.timestamp() * 1000)
+        chunk_size = self._settings.chunk_days * 24 * 60 * 60 * 1000
+
+        return [(chunk_start, min(chunk_start + chunk_size, end)) for chunk_start in range(start, end, chunk_size)]
+
+    def request_chart_range(self, symbol: str, start: int, end: int) -> dict:
+        self._rate_limiter.wait()
+        command_arguments = {"info": {"period": self._settings.period, "start": start, "end": end, "symbol": symbol, "ticks": 0}}
+        try:
+            get_chart_range_request_resp = self.get_client().commandExecute("getChartRangeRequest", command_arguments)
+        except OSError:
+            # a broken connection is replaced on the next attempt
+            self._local.__dict__.pop('client', None)
+            raise
+        if not get_chart_range_request_resp['status']:
+            raise CommandStatusException(f'{symbol} {start}-{end}: {get_chart_range_request_resp.get("errorDescr")}')
+
+        return ExpertAdvisor.get_rate_infos_candles(get_chart_range_request_resp['returnData'])
+
+    def get_chart_range(self, symbol: str, start: int, end: int) -> dict:
+        # the worker thread retries the chunk on its own, the waits double from a second up to ten
+        attempt = 1
+        while True:
+            try:
+                return self.request_chart_range(symbol, start, end)
+            except (CommandStatusException, OSError) as e:
+                logger.warning(f'{symbol}: chunk {start}-{end} attempt no: {attempt} failed: {e}')
+                if attempt == self._settings.chunk_retries:
+                    raise
+
+                time.sleep(min(2 ** (attempt - 1), 10))
+                attempt += 1
+
+    def start(self):
+        chunks = self.get_chunks()
+        logger.info(f'Backfilling {len(self._settings.symbols)} symbols in {len(chunks)} chunks each')
+        failed_chunks = []
+        try:
+            with ThreadPoolExecutor(max_workers=self._settings.workers) as executor:
+                # one symbol at a time, only its chunks are held before they are stored
+                for symbol in self._settings.symbols:
+                    symbol_futures = [executor.submit(self.get_chart_range, symbol, start, end) for start, end in chunks]
+                    # chunks failing all their attempts are left out, the other ones are stored anyway
+                    parts = []
+                    for (start, end), future in zip(chunks, symbol_futures):
+                        try:
+                            parts.append(future.result())
+                        except Exception as e:
+                            logger.error(f'{symbol}: chunk {start}-{end} failed: {e}')
+                            failed_chunks.append(f'{symbol} {start}-{end}')
+                    if len(parts) == 0:
+                        continue
+
+                    candles = {column: np.concatenate([part[column] for part in parts]) for column in CandleStore.columns}
+                    # overlapping chunk bounds and already stored candles are deduplicated on the timestamp
+                    store = CandleStore(self._settings.candle_store_dir, symbol, self._settings.period)
+                    with store.lock():
+                        store.merge(candles)
+                    logger.info(f'{symbol}: {len(parts)}/{len(chunks)} chunks, {len(candles["timestamp"])} candles fetched, '
+                                f'{store.get_count()} stored')
+        finally:
+            for client in self._clients:
+                client.commandExecute('logout')
+                client.disconnect()
+
+        # backfilling the range again fills the gaps, the stored candles are merged with
+        if len(failed_chunks) != 0:
+            raise CommandStatusException(f'{len(failed_chunks)} chunks failed: {", ".join(failed_chunks)}')
+
+
+if __name__ == "__main__":
+    local_tz = pendulum.timezone('Europe/Warsaw')
+    run_at = pendulum.now(tz=local_tz)
+    running_at_string = run_at.strftime("%d/%m/%Y %H:%M:%S")
+    logger.info(f'Process started at: {running_at_string}')
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--symbols', type=str, nargs='+', required=True)
+    parser.add_argument('-pd', '--period', type=int, required=True)
+    parser.add_argument('-f', '--start', type=str, required=True)
+    parser.add_argument('-t', '--end', type=str, required=False, default=None)
+    parser.add_argument('-csd', '--candle_store_dir', type=str, required=False, default=os.getenv('EA_CANDLE_STORE_DIR'))
+    parser.add_argument('-cd', '--chunk_days', type=int, required=False, default=30)
+    parser.add_argument('-w', '--workers', type=int, required=False, default=4)
+    parser.add_argument('-ri', '--request_interval', type=float, required=False, default=0.2)
+    parser.add_argument('-cr', '--chunk_retries', type=int, required=False, default=3)
+
+    args = parser.parse_args()
+    if args.candle_store_dir is None:
+        parser.error('a candle store directory is required, pass -csd or set EA_CANDLE_STORE_DIR')
+
+    backfill_runner_settings = BackfillRunnerSettings(
+        os.getenv('XTB_API_USER'),
+        os.getenv('XTB_API_PASSWORD'),
+        args.symbols,
+        args.period,
+        pendulum.parse(args.start, tz=local_tz),
+        pendulum.parse(args.end, tz=local_tz) if args.end is not None else run_at,
+        args.candle_store_dir,
+        args.chunk_days,
+        args.workers,
+        args.request_interval,
+        args.chunk_retries
+    )
+    BackfillRunner(backfill_runner_settings).start()
+
+    finishing_at_string = pendulum.now(tz=local_tz).strftime("%d/%m/%Y %H:%M:%S")
+    logger.info(f'Process ended at: {finishing_at_string}')
@@ -25,6 +25,8 @@ class EARunnerSettings:
     stop_loss_factor: float
     take_profit_factor: float
     run_at: datetime
+    quantile_estimator: str = None
+    quantile_window: int = None
 
 
 class EARunner:
@@ -100,7 +102,9 @@ class EARunner:
             candle_height_quantile=self._settings.candle_height_quantile,
             regression_candles_count=self._settings.regression_candles_count,
             stop_loss_factor=self._settings.stop_loss_factor,
-            take_profit_factor=self._settings.take_profit_factor
+            take_profit_factor=self._settings.take_profit_factor,
+            quantile_estimator=self._settings.quantile_estimator,
+            quantile_window=self._settings.quantile_window
         )
         strategy = LongShadow(strategy_settings)
 
@@ -109,7 +113,9 @@ class EARunner:
             symbol=self._settings.symbol,
             period=self._settings.period,
             scenario_name=scenario_name,
-            run_at=self._settings.run_at
+            run_at=self._settings.run_at,
+            candle_store_dir=os.getenv('EA_CANDLE_STORE_DIR'),
+            base_period=int(os.environ['EA_BASE_PERIOD']) if 'EA_BASE_PERIOD' in os.environ else None
         )
         ea = ExpertAdvisor(ea_settings)
         raw_df = ea.from_api(drop_non_closed_candle=False)
@@ -149,8 +155,12 @@ if __name__ == "__main__":
     parser.add_argument('-rcc', '--regression_candles_count', type=int, required=True)
     parser.add_argument('-slf', '--stop_loss_factor', type=float, required=True)
     parser.add_argument('-tpf', '--take_profit_factor', type=float, required=True)
+    parser.add_argument('-qe', '--quantile_estimator', type=str, required=False, default=None, choices=['exact', 'p2'])
+    parser.add_argument('-qw', '--quantile_window', type=int, required=False, default=None)
 
     args = parser.parse_args()
+    if args.quantile_window is not None and args.quantile_estimator != 'exact':
+        parser.error('rolling window is supported by the exact quantile estimator only, use --quantile_estimator exact')
     user_id = os.getenv('XTB_API_USER')
     password = os.getenv('XTB_API_PASSWORD')
     symbol = args.symbol
@@ -160,6 +170,8 @@ if __name__ == "__main__":
     regression_candles_count = args.regression_candles_count
     stop_loss_factor = args.stop_loss_factor
     take_profit_factor = args.take_profit_factor
+    quantile_estimator = args.quantile_estimator
+    quantile_window = args.quantile_window
 
     client = APIClient()
     loginResponse = client.execute(loginCommand(userId=user_id, password=password))
@@ -178,7 +190,9 @@ if __name__ == "__main__":
             regression_candles_count,
             stop_loss_factor,
             take_profit_factor,
-            run_at
+            run_at,
+            quantile_estimator,
+            quantile_window
         )
         EARunner(ea_runner_settings).start()
 
@@ -26,6 +26,9 @@ class EARunnerSettings:
     minimum_waves_count: int
     trailing_sl: float
     run_at: datetime
+    checkpoint_dir: str = None
+    quantile_estimator: str = None
+    quantile_window: int = None
 
 
 class EARunner:
@@ -50,6 +53,9 @@ class EARunner:
         mod = self.time_mod(time, delta, epoch)
         return time - mod
 
+    def get_checkpoint_path(self, scenario_name: str, name: str) -> str:
+        return os.path.join(self._settings.checkpoint_dir, f'{scenario_name}-{name}.pickle')
+
     def get_expiration(self, current_time, consolidation_range):
         range_to_mili = consolidation_range.days * 1000 * 24 * 60 * 60 + consolidation_range.seconds * 1000
         half_range = int(range_to_mili / 2)
@@ -96,7 +102,9 @@ class EARunner:
             symbol=self._settings.symbol,
             period=self._settings.period,
             scenario_name=scenario_name,
-            run_at=self._settings.run_at
+            run_at=self._settings.run_at,
+            candle_store_dir=os.getenv('EA_CANDLE_STORE_DIR'),
+            base_period=int(os.environ['EA_BASE_PERIOD']) if 'EA_BASE_PERIOD' in os.environ else None
         )
         ea = ExpertAdvisor(ea_settings)
         raw_dataframe = ea.from_api(drop_non_closed_candle=False)
@@ -106,7 +114,9 @@ class EARunner:
                               distance=self._settings.distance)
         waves_strategy = Waves(waves_settings)
 
-        waves_df = waves_strategy.analyze(raw_dataframe)
+        waves_df = waves_strategy.analyze_incremental(raw_dataframe, self.get_checkpoint_path(scenario_name, 'waves')) \
+            if self._settings.checkpoint_dir is not None \
+            else waves_strategy.analyze(raw_dataframe)
 
         # Consolidation
         trailing_sl = self._settings.trailing_sl
@@ -116,10 +126,14 @@ class EARunner:
             allowed_wave_percent_change=self._settings.allowed_wave_percent_change,
             waves_height_quantile=self._settings.waves_height_quantile,
             minimum_waves_count=self._settings.minimum_waves_count,
-            trailing_sl=trailing_sl
+            trailing_sl=trailing_sl,
+            quantile_estimator=self._settings.quantile_estimator,
+            quantile_window=self._settings.quantile_window
         )
         consolidation_strategy = Consolidation(consolidation_settings)
-        consolidation_df = consolidation_strategy.analyze(waves_df)
+        consolidation_df = consolidation_strategy.analyze_incremental(waves_df, self.get_checkpoint_path(scenario_name, 'consolidation')) \
+            if self._settings.checkpoint_dir is not None \
+            else consolidation_strategy.analyze(waves_df)
 
         last_row = consolidation_df.iloc[-1]
 
@@ -164,12 +178,20 @@ class EARunner:
             logger.info('Oposite orders placing')
             order_input = last_row.to_dict()
             order_input['custom_comment'] = scenario_name
+            prepared_orders = []
             for position_side in list(['bearish', 'bullish']):
                 order_input['position_side'] = position_side
-                prepared_order = self.prepare_order(ea.get_symbol(), order_input)
-                order_resp = ea.open_order_on_signal(prepared_order, ea.execute_tradeTransaction)
+                prepared_orders.append(self.prepare_order(ea.get_symbol(), order_input))
+            # both sides are placed independently - a slow confirmation of one does not hold the other back and,
+            # unlike sending them one after another, the opposite order is sent even when the first one fails
+            order_resps = ea.open_orders_on_signal(prepared_orders, ea.execute_tradeTransaction)
+            for order_resp in order_resps:
                 logger.info(order_resp)
                 self._settings.slack.send(f'{scenario_name}: {str(order_resp)}')
+            # every order is reported first, a failed one still stops the run
+            for order_resp in order_resps:
+                if isinstance(order_resp, Exception):
+                    raise order_resp
         else:
             logger.info('No signal')
 
@@ -188,8 +210,13 @@ if __name__ == "__main__":
     parser.add_argument('-wh', '--waves_height_quantile', type=float, required=True)
     parser.add_argument('-wc', '--minimum_waves_count', type=int, required=True)
     parser.add_argument('-tl', '--trailing_sl', type=float, required=True)
+    parser.add_argument('-cd', '--checkpoint_dir', type=str, required=False, default=None)
+    parser.add_argument('-qe', '--quantile_estimator', type=str, required=False, default=None, choices=['exact', 'p2'])
+    parser.add_argument('-qw', '--quantile_window', type=int, required=False, default=None)
 
     args = parser.parse_args()
+    if args.quantile_window is not None and args.quantile_estimator != 'exact':
+        parser.error('rolling window is supported by the exact quantile estimator only, use --quantile_estimator exact')
     user_id = os.getenv('XTB_API_USER')
     password = os.getenv('XTB_API_PASSWORD')
     symbol = args.symbol
@@ -199,6 +226,9 @@ if __name__ == "__main__":
     waves_height_quantile = args.waves_height_quantile
     minimum_waves_count = args.minimum_waves_count
     trailing_sl = args.trailing_sl
+    checkpoint_dir = args.checkpoint_dir
+    quantile_estimator = args.quantile_estimator
+    quantile_window = args.quantile_window
 
     client = APIClient()
     loginResponse = client.execute(loginCommand(userId=user_id, password=password))
@@ -217,7 +247,10 @@ if __name__ == "__main__":
             waves_height_quantile,
             minimum_waves_count,
             trailing_sl,
-            run_at
+            run_at,
+            checkpoint_dir,
+            quantile_estimator,
+            quantile_window
         )
         EARunner(ea_runner_settings).start()
 
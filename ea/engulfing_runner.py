@@ -115,7 +115,9 @@ class EARunner:
             symbol=self._settings.symbol,
             period=self._settings.period,
             scenario_name=scenario_name,
-            run_at=self._settings.run_at
+            run_at=self._settings.run_at,
+            candle_store_dir=os.getenv('EA_CANDLE_STORE_DIR'),
+            base_period=int(os.environ['EA_BASE_PERIOD']) if 'EA_BASE_PERIOD' in os.environ else None
         )
         ea = ExpertAdvisor(ea_settings)
         raw_df = ea.from_api(drop_non_closed_candle=False)
@@ -132,12 +134,20 @@ class EARunner:
             logger.info('Oposite orders placing')
             order_input = last_row.to_dict()
             order_input['custom_comment'] = scenario_name
+            prepared_orders = []
             for position_side in list(['bearish', 'bullish']):
                 order_input['position_side'] = position_side
-                prepared_order = self.prepare_order(ea.get_symbol(), order_input)
-                order_resp = ea.open_order_on_signal(prepared_order, ea.execute_tradeTransaction)
+                prepared_orders.append(self.prepare_order(ea.get_symbol(), order_input))
+            # both sides are placed independently - a slow confirmation of one does not hold the other back and,
+            # unlike sending them one after another, the opposite order is sent even when the first one fails
+            order_resps = ea.open_orders_on_signal(prepared_orders, ea.execute_tradeTransaction)
+            for order_resp in order_resps:
                 logger.info(order_resp)
                 self._settings.slack.send(f'{scenario_name}: {str(order_resp)}')
+            # every order is reported first, a failed one still stops the run
+            for order_resp in order_resps:
+                if isinstance(order_resp, Exception):
+                    raise order_resp
         else:
             logger.info('No signal')
 
@@ -0,0 +1,97 @@
+import time
+from dataclasses import dataclass, fields
+
+import numpy as np
+from pandas import DataFrame
+
+
+def get_local_utc_offsets(seconds: np.ndarray) -> np.ndarray:
+    # the offset of a day start holds for the whole day unless the next day starts with another one,
+    # only the candles of such transition days are looked up one by one
+    days, day_positions = np.unique(seconds // 86400, return_inverse=True)
+    day_starts = np.r_[days, days[-1:] + 1] * 86400
+    day_start_offsets = np.array([time.localtime(day_start).tm_gmtoff for day_start in day_starts.tolist()], dtype=np.int64)
+
+    offsets = day_start_offsets[day_positions]
+    is_transition_day = (day_start_offsets[:-1] != day_start_offsets[1:])[day_positions]
+    offsets[is_transition_day] = [time.localtime(second).tm_gmtoff for second in seconds[is_transition_day].tolist()]
+
+    return offsets
+
+
+def get_local_date_times(timestamps: np.ndarray) -> np.ndarray:
+    # naive local date times of epoch milliseconds, the same as datetime.fromtimestamp gives
+    seconds = np.asarray(timestamps, dtype=np.int64) // 1000
+    if len(seconds) == 0:
+        return np.empty(0, dtype='datetime64[ns]')
+
+    return (seconds + get_local_utc_offsets(seconds)).astype('datetime64[s]').astype('datetime64[ns]')
+
+
+@dataclass(frozen=True)
+class CandleFrame:
+    # epoch milliseconds of the candle opens, every other column is of the same length
+    timestamp: np.ndarray
+    open: np.ndarray
+    close: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    volume: np.ndarray
+
+    @classmethod
+    def from_columns(cls, columns: dict, dtype=np.float64) -> 'CandleFrame':
+        # arrays which already are contiguous and of the right type are taken over without a copy
+        return cls(**{
+            field.name: np.ascontiguousarray(columns[field.name], dtype=np.int64 if field.name == 'timestamp' else dtype)
+            for field in fields(cls)
+        })
+
+    def __len__(self) -> int:
+        return len(self.timestamp)
+
+    def __getitem__(self, key: slice) -> 'CandleFrame':
+        return CandleFrame(**{field.name: getattr(self, field.name)[key] for field in fields(self)})
+
+    def resample(self, period: int, bucket_offset: int = 0) -> 'CandleFrame':
+        # candles of a higher period, its buckets open bucket_offset milliseconds after the multiples of the period
+        # since the epoch; the leading bucket is left out when the history starts within it
+        if len(self) == 0:
+            return self
+
+        period_ms = period * 60 * 1000
+        bucket_opens = self.timestamp - (self.timestamp - bucket_offset) % period_ms
+        starts = np.flatnonzero(np.r_[True, bucket_opens[1:] != bucket_opens[:-1]])
+        if self.timestamp[0] != bucket_opens[0]:
+            starts = starts[1:]
+        if len(starts) == 0:
+            return self[:0]
+
+        ends = np.r_[starts[1:], len(self)] - 1
+
+        return CandleFrame(
+            timestamp=bucket_opens[starts],
+            open=self.open[starts],
+            close=self.close[ends],
+            high=np.maximum.reduceat(self.high, starts),
+            low=np.minimum.reduceat(self.low, starts),
+            volume=np.add.reduceat(self.volume, starts)
+        )
+
+    def get_date_times(self) -> np.ndarray:
+        return get_local_date_times(self.timestamp)
+
+    def to_dataframe(self) -> DataFrame:
+        # the frame gets its own copies, the columns may be read-only views of the candle store files
+        return DataFrame(dict(
+            date_time=self.get_date_times(),
+            open=self.open,
+            close=self.close,
+            high=self.high,
+            low=self.low,
+            volume=self.volume
+        ), copy=True)
+
+
+def as_dataframe(candles) -> DataFrame:
+    # indicators take a CandleFrame or any frame with the candle columns
+    return candles.to_dataframe() if isinstance(candles, CandleFrame) else candles
@@ -0,0 +1,28 @@
+import os
+import pickle
+
+from ea.misc.logger import logger
+
+
+def load_checkpoint(path: str):
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with open(path, 'rb') as file:
+            return pickle.load(file)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError) as e:
+        logger.warning(f'Ignoring unreadable checkpoint {path}: {e}')
+        return None
+
+
+def save_checkpoint(path: str, state):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    # write aside and swap, so a crashed run never leaves a half written checkpoint
+    temporary_path = f'{path}.tmp'
+    with open(temporary_path, 'wb') as file:
+        pickle.dump(state, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary_path, path)
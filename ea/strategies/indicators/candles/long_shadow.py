@@ -3,7 +3,9 @@ import pandas as pd
 
 from pandas import DataFrame
 
-from sklearn.linear_model import LinearRegression
+from ea.misc.candle_frame import CandleFrame, as_dataframe
+from ea.strategies.indicators.quantile import get_quantile_estimator, get_running_quantiles
+from ea.strategies.indicators.regression import get_rolling_betas
 
 
 class LongShadow:
@@ -11,88 +13,78 @@ class LongShadow:
         self.settings = settings
 
     def is_candle_pattern(self, df, body_ratio):
-        df['is_pattern'] = np.where(
-            ((abs(df['close'] - df['open']) / (df['high'] - df['low'])) < body_ratio),
+        local_df = df.copy()
+        local_df['is_pattern'] = np.where(
+            ((abs(local_df['close'] - local_df['open']) / (local_df['high'] - local_df['low'])) < body_ratio),
             True,
             False
         )
-        return df
+        return local_df
 
     def get_quantile(self, data, quantile):
         return np.quantile(data, quantile)
 
+    def get_hight_threshold(self, hights, quantile):
+        quantile_estimator = self.settings.get('quantile_estimator')
+        if quantile_estimator is None:
+            return self.get_quantile(hights, quantile)
+
+        # every candle is compared with the threshold known at its time, not the one of the whole history -
+        # nothing is carried between runs, so it is slower than np.quantile and only gains causality
+        estimator = get_quantile_estimator(quantile_estimator, quantile, self.settings.get('quantile_window'))
+        return get_running_quantiles(estimator, hights.tolist())
+
     def is_hight_candidate(self, df, quantile):
-        hight_threshold = self.get_quantile((df['high'] - df['low']), quantile)
-        df['is_hight_candidate'] = np.where(
-            ((df['high'] - df['low']) > hight_threshold),
+        local_df = df.copy()
+        hight_threshold = self.get_hight_threshold((local_df['high'] - local_df['low']), quantile)
+        local_df['is_hight_candidate'] = np.where(
+            ((local_df['high'] - local_df['low']) > hight_threshold),
             True,
             False
         )
-        return df
-
-    def calculate_beta_coefficient(self, df):
-        x = np.array(range(len(df))).reshape((-1, 1))
-        y = df.close
-
-        model = LinearRegression().fit(x, y)
-        coefficient = model.coef_[0]
-        return coefficient
-
-    def get_beta_coefficient(self, df):
-        return pd.DataFrame([[max(df.date_time), self.calculate_beta_coefficient(df)]], columns=['date_time', 'beta'])
+        return local_df
 
     def apply_beta_coefficient(self, df, lookup):
-        candidate_candles_idxs = df[(df['is_pattern']) & (df['is_hight_candidate'])].index.tolist()
-        initial_ranges = [df.iloc[idx - lookup + 1:idx + 1] for idx in candidate_candles_idxs]
+        local_df = df.copy()
+        # slope of close over the lookup candles ending at every candle, candidates without such a history get none
+        betas = np.zeros(len(local_df))
+        betas[lookup - 1:] = get_rolling_betas(local_df['close'], lookup)
 
-        coefficient_dfs = [self.get_beta_coefficient(rng_df) for rng_df in initial_ranges if not rng_df.empty]
-        coefficient_df = pd.concat(coefficient_dfs)
+        is_candidate = (local_df['is_pattern'] & local_df['is_hight_candidate']).to_numpy()
+        local_df['beta'] = np.where(is_candidate, betas, 0.0)
 
-        merged_df = pd.merge(
-            df, coefficient_df,
-            how='left',
-            on=['date_time']
-        )
-
-        merged_df.fillna({'beta': 0.0}, inplace=True)
-
-        return merged_df
-
-    def categorize_shadow(self, row):
-        open = row['open']
-        close = row['close']
-        high = row['high']
-        low = row['low']
-        result = None
-        if ((high - max([open, close])) > (min([open, close]) - low)):
-            result = 'up'
-        elif ((high - max([open, close])) < (min([open, close]) - low)):
-            result = 'down'
-        else:
-            result = 'unrecognized'
-
-        return result
+        return local_df
 
     def get_shadow_side(self, df):
-        df['shadow_side'] = df.apply(self.categorize_shadow, axis=1)
-        return df
+        local_df = df.copy()
+        opens = local_df['open'].to_numpy(dtype=float)
+        closes = local_df['close'].to_numpy(dtype=float)
+        upper_shadows = local_df['high'].to_numpy(dtype=float) - np.maximum(opens, closes)
+        lower_shadows = np.minimum(opens, closes) - local_df['low'].to_numpy(dtype=float)
+
+        local_df['shadow_side'] = pd.Categorical(
+            np.select([upper_shadows > lower_shadows, upper_shadows < lower_shadows], ['up', 'down'], 'unrecognized'),
+            categories=['up', 'down', 'unrecognized']
+        )
+        return local_df
 
     # PnL
     @staticmethod
     def get_open_position_signals(df):
-        df['is_signal'] = np.where(
-            (df['is_pattern']) & (df['is_hight_candidate']),
+        local_df = df.copy()
+        local_df['is_signal'] = np.where(
+            (local_df['is_pattern']) & (local_df['is_hight_candidate']),
             True,
             False
         )
-        return df
+        return local_df
 
-    def analyze(self, dataframe: DataFrame) -> DataFrame:
+    def analyze(self, dataframe: DataFrame | CandleFrame) -> DataFrame:
         candle_body_ratio = self.settings['candle_body_ratio']
         candle_height_quantile = self.settings['candle_height_quantile']
         regression_candles_count = self.settings['regression_candles_count']
         # checking on the pattern
-        pattern_checked_df = self.is_candle_pattern(dataframe, candle_body_ratio)
+        pattern_checked_df = self.is_candle_pattern(as_dataframe(dataframe), candle_body_ratio)
         # based on the quantile analysis
         hight_analyzed_df = self.is_hight_candidate(pattern_checked_df, candle_height_quantile)
         #
@@ -1,11 +1,40 @@
-from datetime import datetime
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
 
 import numpy as np
 import pandas as pd
-import plotly.graph_objects as go
-from pandas import DataFrame
-from plotly.graph_objs import Figure
-from plotly.subplots import make_subplots
+from pandas import DataFrame, Timestamp
+
+from ea.misc.checkpoint import load_checkpoint, save_checkpoint
+from ea.strategies.indicators.quantile import get_quantile_estimator, get_running_quantiles
+
+if TYPE_CHECKING:
+    from plotly.graph_objs import Figure
+
+
+@dataclass
+class ConsolidationState:
+    allowed_wave_percent_change: float
+    waves_height_quantile: float
+    minimum_waves_count: int
+    quantile_estimator: str = None
+    quantile_window: int = None
+    wave_height_threshold: float = None
+    # streaming estimator of the wave heights quantile - every wave gets the threshold known at its time
+    heights_quantile: object = None
+    iterator: int = 1
+    lower_bound: float = 0.0
+    upper_bound: float = 1000000.0
+    last_wave: DataFrame = None
+    consolidation_info: DataFrame = None
+    # price ranges of the segments closed by a later iterator == 1 wave and of the open one
+    price_ranges: DataFrame = None
+    open_price_ranges: DataFrame = None
+    open_segment_start: int = 0
+    # candles since the start of the recent consolidation or of the open segment, whichever comes first
+    candles: DataFrame = None
+    retained_start_at: Timestamp = None
+    last_candle_at: Timestamp = None
 
 
 class Consolidation:
@@ -25,52 +54,73 @@ class Consolidation:
                                        allowed_percent_change: float,
                                        waves_height_quantile: float,
                                        minimum_waves_count: int) -> DataFrame:
-        collection = dataframe.to_dict('index')
-
-        wave_height_threshold = self.get_quantile(dataframe['height'], waves_height_quantile)
-
-        consolidation_info = []
-
-        lower_bound = 0.0
-        upper_bound = 1000000.0
-
-        iterator = 1
-        bullish_multiplier = self.get_multiplication_factor(-1 * allowed_percent_change, iterator)
-        bearish_multiplier = self.get_multiplication_factor(allowed_percent_change, iterator)
-        for key in collection:
-            break_at = collection[key]['break_time']
-            current_market = collection[key]['market']
-            current_break_value = collection[key]['break_value']
-            current_wave_height = collection[key]['height']
+        state = self.get_new_state(allowed_percent_change, waves_height_quantile, minimum_waves_count)
+
+        if state.heights_quantile is not None:
+            wave_height_thresholds = get_running_quantiles(state.heights_quantile, dataframe['height'].tolist())
+        else:
+            state.wave_height_threshold = self.get_quantile(dataframe['height'], waves_height_quantile)
+            wave_height_thresholds = np.full(len(dataframe), state.wave_height_threshold)
+
+        return self.process_time_ranges(state, dataframe, wave_height_thresholds)
+
+    def get_new_state(self, allowed_percent_change: float, waves_height_quantile: float, minimum_waves_count: int) -> ConsolidationState:
+        quantile_estimator = self.settings.get('quantile_estimator')
+        quantile_window = self.settings.get('quantile_window')
+
+        return ConsolidationState(
+            allowed_wave_percent_change=allowed_percent_change,
+            waves_height_quantile=waves_height_quantile,
+            minimum_waves_count=minimum_waves_count,
+            quantile_estimator=quantile_estimator,
+            quantile_window=quantile_window,
+            heights_quantile=get_quantile_estimator(quantile_estimator, waves_height_quantile, quantile_window)
+            if quantile_estimator is not None
+            else None
+        )
 
-            if current_market == 'bullish':
+    def process_time_ranges(self, state: ConsolidationState, dataframe: DataFrame, wave_height_thresholds) -> DataFrame:
+        allowed_percent_change = state.allowed_wave_percent_change
+        minimum_waves_count = state.minimum_waves_count
+
+        is_bullish = (dataframe['market'] == 'bullish').to_numpy()
+        is_bearish = (dataframe['market'] == 'bearish').to_numpy()
+        break_values = dataframe['break_value'].to_numpy(dtype=float)
+        heights = dataframe['height'].to_numpy(dtype=float)
+
+        waves_count = len(dataframe)
+        consolidation_info = np.zeros(waves_count, dtype=bool)
+        iterators = np.zeros(waves_count, dtype=np.int64)
+        lower_bounds = np.full(waves_count, np.nan)
+        upper_bounds = np.full(waves_count, np.nan)
+
+        bullish_multiplier = self.get_multiplication_factor(-1 * allowed_percent_change, 1)
+        bearish_multiplier = self.get_multiplication_factor(allowed_percent_change, 1)
+
+        lower_bound = state.lower_bound
+        upper_bound = state.upper_bound
+        iterator = state.iterator
+        waves = zip(is_bullish.tolist(), is_bearish.tolist(), break_values.tolist(), heights.tolist(), wave_height_thresholds.tolist())
+        for key, (bullish, bearish, current_break_value, current_wave_height, wave_height_threshold) in enumerate(waves):
+            if bullish:
                 # check
                 if current_wave_height > wave_height_threshold:
                     if current_break_value < lower_bound:
                         iterator = 1
                         upper_bound = 1000000.0
                         lower_bound = current_break_value * bullish_multiplier
-                        consolidation_info.append(
-                            {**collection[key],
-                             **{'iterator': iterator, 'lower_bound': lower_bound, 'lower_break': current_break_value}}
-                        )
+                        consolidation_info[key], iterators[key], lower_bounds[key] = True, iterator, lower_bound
                     elif current_break_value > lower_bound:
                         lower_bound = current_break_value * bullish_multiplier
                         upper_bound = 1000000.0
-                        consolidation_info.append(
-                            {**collection[key],
-                             **{'iterator': iterator, 'lower_bound': lower_bound, 'lower_break': current_break_value}}
-                        )
+                        consolidation_info[key], iterators[key], lower_bounds[key] = True, iterator, lower_bound
                         iterator = 1
                 elif current_wave_height < wave_height_threshold:
                     if current_break_value < lower_bound:
                         iterator = 1
                         upper_bound = 1000000.0
                         lower_bound = current_break_value * bullish_multiplier
-                        consolidation_info.append(
-                            {**collection[key],
-                             **{'iterator': iterator, 'lower_bound': lower_bound, 'lower_break': current_break_value}}
-                        )
+                        consolidation_info[key], iterators[key], lower_bounds[key] = True, iterator, lower_bound
                         # iterator = iterator + 1
                     elif current_break_value > lower_bound:
                         base_value = None
@@ -80,44 +130,32 @@ class Consolidation:
                             base_value = lower_bound
 
                         lower_bound = base_value * self.get_multiplication_factor(-1 * allowed_percent_change, iterator)
-                        consolidation_info.append(
-                            {**collection[key],
-                             **{'iterator': iterator, 'lower_bound': lower_bound, 'lower_break': current_break_value}}
-                        )
+                        consolidation_info[key], iterators[key], lower_bounds[key] = True, iterator, lower_bound
                         if (iterator < minimum_waves_count):
                             iterator = iterator + 1
                         else:
                             upper_bound = 1000000.0
                             iterator = 1
-            if current_market == 'bearish':
+            if bearish:
                 # check
                 if current_wave_height > wave_height_threshold:
                     if current_break_value > upper_bound:
                         iterator = 1
                         lower_bound = 0
                         upper_bound = current_break_value * bearish_multiplier
-                        consolidation_info.append(
-                            {**collection[key],
-                             **{'iterator': iterator, 'upper_bound': upper_bound, 'upper_break': current_break_value}}
-                        )
+                        consolidation_info[key], iterators[key], upper_bounds[key] = True, iterator, upper_bound
                         # iterator = iterator + 1
                     elif current_break_value < upper_bound:
                         lower_bound = 0
                         upper_bound = current_break_value * bearish_multiplier
-                        consolidation_info.append(
-                            {**collection[key],
-                             **{'iterator': iterator, 'upper_bound': upper_bound, 'upper_break': current_break_value}}
-                        )
+                        consolidation_info[key], iterators[key], upper_bounds[key] = True, iterator, upper_bound
                         iterator = 1
                 elif current_wave_height < wave_height_threshold:
                     if current_break_value > upper_bound:
                         iterator = 1
                         lower_bound = 0
                         upper_bound = current_break_value * bearish_multiplier
-                        consolidation_info.append(
-                            {**collection[key],
-                             **{'iterator': iterator, 'upper_bound': upper_bound, 'upper_break': current_break_value}}
-                        )
+                        consolidation_info[key], iterators[key], upper_bounds[key] = True, iterator, upper_bound
                         # iterator = iterator + 1
                     elif current_break_value < upper_bound:
                         base_value = None
@@ -127,75 +165,99 @@ class Consolidation:
                             base_value = upper_bound
 
                         upper_bound = base_value * self.get_multiplication_factor(allowed_percent_change, iterator)
-                        consolidation_info.append(
-                            {**collection[key],
-                             **{'iterator': iterator, 'upper_bound': upper_bound, 'upper_break': current_break_value}}
-                        )
+                        consolidation_info[key], iterators[key], upper_bounds[key] = True, iterator, upper_bound
                         if (iterator < minimum_waves_count):
                             iterator = iterator + 1
                         else:
                             iterator = 1
                             lower_bound = 0
 
-        return pd.DataFrame(consolidation_info)
+        state.lower_bound = lower_bound
+        state.upper_bound = upper_bound
+        state.iterator = iterator
 
-    def get_price_ranges(self, dataframe: DataFrame) -> DataFrame:
-        consolidation_start = dataframe.break_time.min()
-        consolidation_id = dataframe.break_time.max()
+        return self.with_consolidation_info(dataframe, consolidation_info, iterators, lower_bounds, upper_bounds)
 
-        dataframe['consolidation_min'] = dataframe['lower_break'].min()
-        dataframe['consolidation_max'] = dataframe['upper_break'].max()
+    @staticmethod
+    def with_consolidation_info(dataframe: DataFrame, consolidation_info, iterators, lower_bounds, upper_bounds) -> DataFrame:
+        if not consolidation_info.any():
+            return pd.DataFrame()
+
+        consolidation_info_df = dataframe[consolidation_info].reset_index(drop=True)
+        consolidation_info_df['iterator'] = iterators[consolidation_info]
+
+        # bounds columns show up in the order the markets do, only for markets which produced a bound
+        break_values = consolidation_info_df['break_value'].to_numpy(dtype=float)
+        for market in pd.unique(consolidation_info_df['market']):
+            is_market = (consolidation_info_df['market'] == market).to_numpy()
+            if market == 'bullish':
+                consolidation_info_df['lower_bound'] = lower_bounds[consolidation_info]
+                consolidation_info_df['lower_break'] = np.where(is_market, break_values, np.nan)
+            elif market == 'bearish':
+                consolidation_info_df['upper_bound'] = upper_bounds[consolidation_info]
+                consolidation_info_df['upper_break'] = np.where(is_market, break_values, np.nan)
+
+        return consolidation_info_df
 
-        dataframe['consolidation_start'] = consolidation_start
-        dataframe['consolidation_id'] = consolidation_id
+    def get_price_ranges(self, dataframe: DataFrame) -> DataFrame:
+        # one grouped pass over all consolidations
+        price_ranges = dataframe.groupby('segment_id').agg(
+            consolidation_min=('lower_break', 'min'),
+            consolidation_max=('upper_break', 'max'),
+            consolidation_start=('break_time', 'min'),
+            consolidation_id=('break_time', 'max')
+        )
 
-        return dataframe[['break_time', 'iterator', 'consolidation_min', 'consolidation_max', 'consolidation_start', 'consolidation_id']]
+        with_price_ranges_df = dataframe.join(price_ranges, on='segment_id')
 
-    def get_consolidations_price_ranges(self, dataframe: DataFrame, minimum_waves_count: int) -> DataFrame:
-        local_df = dataframe.copy()
+        return with_price_ranges_df[['break_time', 'iterator', 'consolidation_min', 'consolidation_max', 'consolidation_start', 'consolidation_id']]
+
+    def get_segments_price_ranges(self, dataframe: DataFrame, minimum_waves_count: int) -> DataFrame:
         columns = ['break_time', 'iterator', 'lower_break', 'upper_break']
-        collection = local_df.to_dict('index')
-
-        # divide into pieces
-        consolidation_price_ranges_df = pd.DataFrame()
-        current_sub_df = pd.DataFrame()
-        for key in collection:
-            break_time = collection[key]['break_time']
-            iterator = collection[key]['iterator']
-            lower_bound = collection[key]['lower_break']
-            upper_bound = collection[key]['upper_break']
-
-            row_df = pd.DataFrame([[break_time, iterator, lower_bound, upper_bound]], columns=columns)
-
-            if (iterator == 1) and (len(current_sub_df) != 0):
-                if len(current_sub_df) == minimum_waves_count:
-                    with_consolidation_price_ranges_df = self.get_price_ranges(current_sub_df)
-                    consolidation_price_ranges_df = pd.concat(
-                        [consolidation_price_ranges_df, with_consolidation_price_ranges_df],
-                        axis=0
-                    )
-
-                current_sub_df = row_df
-            else:
-                current_sub_df = pd.concat([current_sub_df, row_df], axis=0)
-
-            if len(current_sub_df) == minimum_waves_count:
-                with_consolidation_price_ranges_df = self.get_price_ranges(current_sub_df)
-                consolidation_price_ranges_df = pd.concat(
-                    [consolidation_price_ranges_df, with_consolidation_price_ranges_df],
-                    axis=0
-                )
+
+        # divide into pieces - every iterator == 1 wave starts a new one
+        iterators = dataframe['iterator'].to_numpy()
+        positions = np.arange(len(dataframe))
+        is_segment_start = (iterators == 1) | (positions == 0)
+        segment_ids = np.cumsum(is_segment_start) - 1
+        positions_in_segment = positions - positions[is_segment_start][segment_ids]
+        segment_lengths = np.bincount(segment_ids, minlength=1)
+
+        # consolidation is made of the first minimum_waves_count waves of a long enough piece
+        is_consolidation_wave = (positions_in_segment < minimum_waves_count) \
+            & (segment_lengths[segment_ids] >= minimum_waves_count)
+
+        consolidation_waves_df = dataframe.loc[is_consolidation_wave, columns]
+        consolidation_waves_df['segment_id'] = segment_ids[is_consolidation_wave]
+        price_ranges_df = self.get_price_ranges(consolidation_waves_df)
+        price_ranges_df['segment_id'] = consolidation_waves_df['segment_id']
+
+        return price_ranges_df
+
+    @staticmethod
+    def with_price_ranges(dataframe: DataFrame, price_ranges_df: DataFrame) -> DataFrame:
+        if price_ranges_df.empty:
+            return pd.DataFrame()
 
         with_consolidations_df = pd.merge(
-            local_df[['break_time', 'market', 'iterator']], consolidation_price_ranges_df[
+            dataframe[['break_time', 'market', 'iterator']], price_ranges_df[
                 ['break_time', 'iterator', 'consolidation_min', 'consolidation_max', 'consolidation_start', 'consolidation_id']],
             how='left',
             on=['break_time', 'iterator']
-        ) if not consolidation_price_ranges_df.empty else pd.DataFrame()
+        )
         with_consolidations_df.drop_duplicates(subset=['break_time', 'iterator'], keep='first', inplace=True, ignore_index=True)
 
         return with_consolidations_df
 
+    def get_consolidations_price_ranges(self, dataframe: DataFrame, minimum_waves_count: int) -> DataFrame:
+        if dataframe.empty:
+            return pd.DataFrame()
+
+        local_df = dataframe.copy()
+        consolidation_price_ranges_df = self.get_segments_price_ranges(local_df, minimum_waves_count)
+
+        return self.with_price_ranges(local_df, consolidation_price_ranges_df)
+
     def collect_consolidations(self,
                                dataframe: DataFrame,
                                allowed_percent_change: float,
@@ -230,6 +292,10 @@ class Consolidation:
             minimum_waves_count
         )
 
+        return self.with_consolidations(dataframe, with_consolidations_df)
+
+    @staticmethod
+    def with_consolidations(dataframe: DataFrame, with_consolidations_df: DataFrame) -> DataFrame:
         return pd.merge(
             dataframe, with_consolidations_df[['break_time', 'market', 'iterator', 'consolidation_min', 'consolidation_max', 'consolidation_start', 'consolidation_id']],
             how='left',
@@ -238,73 +304,185 @@ class Consolidation:
 
     @staticmethod
     def get_open_position_signals(dataframe: DataFrame) -> DataFrame:
-        # 1. pandas.core.base.DataError: No numeric types to aggregate, using numeric representation instead for expanding aggregation
-        # 2. candle time is UTC based, converting to int (lambda) and back to timestamp with_last_consolidation_end introducing +2 factor: 2 * 60 * 60
-        dataframe['recent_consolidation_end'] = dataframe['consolidation_id'] \
-            .apply(lambda x: x.value / 1000000000 - (2 * 60 * 60) if x.value > 0 else 0) \
-            .expanding(1) \
-            .max()
-
-        with_last_consolidation_end = dataframe[dataframe['recent_consolidation_end'] > 0].copy()
-        with_last_consolidation_end['recent_consolidation_end'] = with_last_consolidation_end['recent_consolidation_end'] \
-            .apply(lambda x: datetime.fromtimestamp(int(x)))
-
-        aggregated = with_last_consolidation_end \
-            .groupby(['recent_consolidation_end'])[['recent_consolidation_end', 'consolidation_min', 'consolidation_max']] \
-            .agg(recent_consolidation_end=('recent_consolidation_end', 'max'),
-                 recent_consolidation_min=('consolidation_min', 'max'),
-                 recent_consolidation_max=('consolidation_max', 'max')
-                 ) \
-            .reset_index(drop=True)
-
-        joined = pd.merge(
-            with_last_consolidation_end, aggregated,
-            how='left',
-            on=['recent_consolidation_end']
+        # consolidation ids are candle times already, no timezone shift is needed - the recent end is the latest id so far
+        consolidation_ids = dataframe['consolidation_id'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+        recent_consolidation_ends = np.maximum.accumulate(consolidation_ids)
+        is_after_consolidation = recent_consolidation_ends > 0
+
+        joined = dataframe[is_after_consolidation].reset_index(drop=True)
+        recent_consolidation_ends = recent_consolidation_ends[is_after_consolidation]
+        joined['recent_consolidation_end'] = recent_consolidation_ends.view('datetime64[ns]').astype(dataframe['consolidation_id'].dtype)
+
+        # ends never decrease, so every recent consolidation is a contiguous run of candles
+        is_group_start = np.diff(recent_consolidation_ends, prepend=0) != 0
+        group_starts = np.flatnonzero(is_group_start)
+        group_ids = np.cumsum(is_group_start) - 1
+
+        recent_consolidation_min = np.fmax.reduceat(joined['consolidation_min'].to_numpy(dtype=float), group_starts)[group_ids]
+        recent_consolidation_max = np.fmax.reduceat(joined['consolidation_max'].to_numpy(dtype=float), group_starts)[group_ids]
+        joined['recent_consolidation_min'] = recent_consolidation_min
+        joined['recent_consolidation_max'] = recent_consolidation_max
+        joined['recent_consolidation_mid'] = recent_consolidation_max - (recent_consolidation_max - recent_consolidation_min) / 2
+
+        closes = joined['close'].to_numpy(dtype=float)
+        is_after_consolidation_end = joined['date_time'].to_numpy(dtype='datetime64[ns]').view(np.int64) > recent_consolidation_ends
+        is_bullish_break = is_after_consolidation_end & (closes > recent_consolidation_max)
+        is_bearish_break = is_after_consolidation_end & (closes < recent_consolidation_min)
+        is_break = is_bullish_break | is_bearish_break
+
+        joined['consolidation_break_at'] = np.where(is_break, joined['date_time'], np.datetime64('now'))
+        joined['position_side'] = np.select([is_bullish_break, is_bearish_break], ['bullish', 'bearish'], default='nan')
+
+        # position is opened on the first break of the recent consolidation
+        consolidation_break_at = joined['consolidation_break_at'].to_numpy()
+        first_break_at = np.minimum.reduceat(consolidation_break_at, group_starts)[group_ids]
+        joined['open_position_at'] = np.where(
+            is_break & (consolidation_break_at == first_break_at),
+            consolidation_break_at,
+            np.datetime64('NaT')
         )
 
-        joined['recent_consolidation_mid'] = \
-            joined['recent_consolidation_max'] - (joined['recent_consolidation_max'] - joined['recent_consolidation_min']) / 2
+        return joined
 
-        numpy_now = np.datetime64('now')
+    def process_waves(self, state: ConsolidationState, dataframe: DataFrame):
+        if dataframe.empty:
+            return
 
-        joined['consolidation_break_at'] = np.where(
-            joined['date_time'] > joined['recent_consolidation_end'],
-            np.where(
-                (joined['close'] > joined['recent_consolidation_max']) | (joined['close'] < joined['recent_consolidation_min']),
-                joined['date_time'],
-                numpy_now
-            ),
-            numpy_now
-        )
+        waves_df = self.initial_processing(pd.concat([state.last_wave, dataframe], ignore_index=True))
+        state.last_wave = dataframe[['market', 'break_time', 'break_value']].iloc[-1:]
+        if waves_df.empty:
+            return
 
-        joined['position_side'] = np.where(
-            joined['date_time'] > joined['recent_consolidation_end'],
-            np.where(
-                joined['close'] > joined['recent_consolidation_max'],
-                'bullish',
-                np.where(
-                    joined['close'] < joined['recent_consolidation_min'],
-                    'bearish',
-                    np.nan
-                )
-            ),
-            np.nan
-        )
+        # thresholds of the waves already seen never change
+        wave_height_thresholds = get_running_quantiles(state.heights_quantile, waves_df['height'].tolist())
 
-        consolidation_break_at = joined \
-            .groupby(['recent_consolidation_end']) \
-            .agg(open_position_at=pd.NamedAgg('consolidation_break_at', 'min')) \
-            .reset_index(drop=True)
+        consolidation_info_df = self.process_time_ranges(state, waves_df, wave_height_thresholds)
+        if not consolidation_info_df.empty:
+            state.consolidation_info = pd.concat([state.consolidation_info, consolidation_info_df], ignore_index=True)
+            self.process_price_ranges(state)
 
-        with_open_position_signals = pd.merge(
-            joined, consolidation_break_at,
-            how='left',
-            left_on='date_time',
-            right_on='open_position_at'
-        )
+    def process_price_ranges(self, state: ConsolidationState):
+        # only the open segment can still change
+        open_segments_df = state.consolidation_info.iloc[state.open_segment_start:].reset_index(drop=True)
+        price_ranges_df = self.get_segments_price_ranges(open_segments_df, state.minimum_waves_count)
 
-        return with_open_position_signals
+        iterators = open_segments_df['iterator'].to_numpy()
+        segment_starts = np.flatnonzero((iterators == 1) | (np.arange(len(iterators)) == 0))
+        is_closed = price_ranges_df['segment_id'] < len(segment_starts) - 1
+        if is_closed.any():
+            state.price_ranges = pd.concat([state.price_ranges, price_ranges_df[is_closed]], ignore_index=True)
+        state.open_price_ranges = price_ranges_df[~is_closed]
+        state.open_segment_start += int(segment_starts[-1])
+
+    def get_incremental_consolidations(self, state: ConsolidationState, dataframe: DataFrame) -> DataFrame:
+        if state.consolidation_info is None:
+            return pd.DataFrame()
+
+        price_ranges_df = pd.concat([state.price_ranges, state.open_price_ranges], ignore_index=True)
+        with_consolidations_df = self.with_price_ranges(state.consolidation_info, price_ranges_df)
+
+        return self.with_consolidations(dataframe, with_consolidations_df)
+
+    @staticmethod
+    def get_candles(state: ConsolidationState, dataframe: DataFrame) -> DataFrame:
+        carried_candles_df = state.candles[state.candles['date_time'] < dataframe['date_time'].iloc[0]] \
+            if state.candles is not None \
+            else pd.DataFrame()
+
+        return pd.concat([carried_candles_df, dataframe], ignore_index=True) \
+            if not carried_candles_df.empty \
+            else dataframe.reset_index(drop=True)
+
+    @staticmethod
+    def get_recent_consolidation_start(dataframe: DataFrame, history_start: Timestamp) -> int:
+        # signals of the current history depend on the candles since the start of its first recent consolidation only
+        consolidation_ids = dataframe['consolidation_id'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+        recent_consolidation_ends = np.maximum.accumulate(consolidation_ids)
+        history_position = np.searchsorted(dataframe['date_time'].to_numpy(), np.datetime64(history_start))
+        recent_consolidation_end = recent_consolidation_ends[history_position]
+
+        return int(np.argmax(recent_consolidation_ends == recent_consolidation_end)) \
+            if recent_consolidation_end != np.iinfo(np.int64).min \
+            else int(history_position)
+
+    @staticmethod
+    def get_recent_consolidations(dataframe: DataFrame, history_start: Timestamp) -> DataFrame:
+        return dataframe.iloc[Consolidation.get_recent_consolidation_start(dataframe, history_start):].reset_index(drop=True)
+
+    def trim_state(self, state: ConsolidationState, candles_df: DataFrame, history_start: Timestamp):
+        # later histories start no earlier - their recent consolidation starts no earlier either,
+        # while waves of the open segment might still make a consolidation reaching back to its start
+        consolidations_df = self.get_incremental_consolidations(state, candles_df)
+        retained_start = self.get_recent_consolidation_start(consolidations_df, history_start) \
+            if not consolidations_df.empty \
+            else int(np.searchsorted(candles_df['date_time'].to_numpy(), np.datetime64(history_start)))
+
+        if state.consolidation_info is not None:
+            open_segment_at = state.consolidation_info['break_time'].iloc[state.open_segment_start]
+            is_open_segment_wave = candles_df['market'].notnull().to_numpy() & (candles_df['break_time'] >= open_segment_at).to_numpy()
+            retained_start = min(retained_start, int(np.argmax(is_open_segment_wave)))
+
+            # consolidation rows go with the waves of the retained candles, break times follow the order of waves
+            retained_waves = candles_df['break_time'].iloc[retained_start:][candles_df['market'].iloc[retained_start:].notnull()]
+            retained_break_time = retained_waves.iloc[0]
+            is_retained = (state.consolidation_info['break_time'] >= retained_break_time).to_numpy()
+            state.open_segment_start -= int(np.argmax(is_retained))
+            state.consolidation_info = state.consolidation_info[is_retained].reset_index(drop=True)
+            if state.price_ranges is not None:
+                state.price_ranges = state.price_ranges[state.price_ranges['break_time'] >= retained_break_time].reset_index(drop=True)
+
+        state.candles = candles_df.iloc[retained_start:-1].reset_index(drop=True)
+        state.retained_start_at = candles_df['date_time'].iloc[retained_start]
+
+    def get_state(self, dataframe: DataFrame, checkpoint_path: str) -> ConsolidationState:
+        new_state = self.get_new_state(
+            self.settings['allowed_wave_percent_change'],
+            self.settings['waves_height_quantile'],
+            self.settings['minimum_waves_count']
+        )
+        settings = ['allowed_wave_percent_change', 'waves_height_quantile', 'minimum_waves_count', 'quantile_estimator', 'quantile_window']
+        state = load_checkpoint(checkpoint_path)
+
+        if state is None or any(getattr(state, name) != getattr(new_state, name) for name in settings):
+            return new_state
+        if state.last_candle_at is not None and state.last_candle_at < dataframe['date_time'].iloc[0]:
+            # waves between the checkpoint and the current history are missing, start over
+            return new_state
+        if state.retained_start_at is not None and dataframe['date_time'].iloc[0] < state.retained_start_at:
+            # the current history reaches further back than the checkpoint does
+            return new_state
+
+        return state
+
+    def analyze_incremental(self, dataframe: DataFrame, checkpoint_path: str) -> DataFrame:
+        if self.settings.get('quantile_estimator') is None:
+            # a threshold over the whole history moves with every tick and might reclassify any wave - nothing can be carried over
+            return self.analyze(dataframe)
+
+        state = self.get_state(dataframe, checkpoint_path)
+        history_start = dataframe['date_time'].iloc[0]
+        last_candle_at = dataframe['date_time'].iloc[-1]
+        candles_df = self.get_candles(state, dataframe)
+
+        waves_df = dataframe[dataframe['market'].notnull()]
+        if state.last_candle_at is not None:
+            waves_df = waves_df[waves_df['date_time'] > state.last_candle_at]
+
+        # waves confirmed on the most recent candle might not hold - they are taken into account but never checkpointed
+        self.process_waves(state, waves_df[waves_df['date_time'] < last_candle_at])
+        self.trim_state(state, candles_df, history_start)
+        if len(dataframe) > 1:
+            state.last_candle_at = dataframe['date_time'].iloc[-2]
+        save_checkpoint(checkpoint_path, state)
+
+        self.process_waves(state, waves_df[waves_df['date_time'] == last_candle_at])
+        consolidations_df = self.get_incremental_consolidations(state, candles_df)
+        if consolidations_df.empty:
+            return pd.DataFrame()
+
+        with_open_position_signals = self.get_open_position_signals(self.get_recent_consolidations(consolidations_df, history_start))
+
+        return with_open_position_signals[with_open_position_signals['date_time'] >= history_start].reset_index(drop=True)
 
     def analyze(self, dataframe: DataFrame) -> DataFrame:
         allowed_wave_percent_change = self.settings['allowed_wave_percent_change']
@@ -317,8 +495,11 @@ class Consolidation:
 
         return with_open_position_signals
 
-    def plot_with_consolidation_ranges(self, dataframe: DataFrame, figure: Figure) -> Figure:
+    def plot_with_consolidation_ranges(self, dataframe: DataFrame, figure: 'Figure') -> 'Figure':
         # return None
+        # plotting is never used by the runners, plotly is imported only when a chart is drawn
+        import plotly.graph_objects as go
+
         filtered_df = dataframe[dataframe['consolidation_id'].notnull()]
 
         # https://www.shanelynn.ie/summarising-aggregation-and-grouping-data-in-python-pandas/
@@ -345,6 +526,9 @@ class Consolidation:
 
     def plot_chart(self, symbol, dataframe):
         # return None
+        import plotly.graph_objects as go
+        from plotly.subplots import make_subplots
+
         fig = make_subplots(rows=1, cols=1, shared_xaxes=True, specs=[[{"secondary_y": True}]])
         fig.add_trace(go.Candlestick(x=dataframe["date_time"],
                                      open=dataframe["open"],
@@ -1,7 +1,8 @@
 import numpy as np
-import pandas as pd
 from pandas import DataFrame
 
+from ea.misc.candle_frame import CandleFrame, as_dataframe
+
 
 class Engulfing:
     def __init__(self, settings):
@@ -33,37 +34,23 @@ class Engulfing:
 
     # "Loops in pandas are a sin."
     def apply_counting(self, df):
-        candles_count = 0
-        values = []
-        recent_low = None
-        recent_high = None
-        recent_consolidation_start = None
-        recent_index = None
-
-        for idx in range(len(df)):
-            if df.loc[idx, 'check'] == 1:
-                candles_count += 1
-            else:
-                recent_low = df.loc[idx, 'low']
-                recent_high = df.loc[idx, 'high']
-                recent_consolidation_start = df.loc[idx, 'date_time']
-                recent_index = idx
-                candles_count = 0
-
-            values.append(
-                (df.loc[idx, 'date_time'], recent_low, recent_high, recent_consolidation_start, recent_index, candles_count))
-
-        candles_count_df = pd.DataFrame(
-            values,
-            columns=['date_time', 'recent_low', 'recent_high', 'recent_consolidation_start', 'index', 'candles_count']
-        )
+        local_df = df.copy()
+        # every candle which is not inside the previous one starts a new group,
+        # candles of a group are counted and get the low/high/start of the candle which started it
+        positions = np.arange(len(local_df))
+        is_group_start = local_df['check'].to_numpy() != 1
+        group_starts = np.maximum.accumulate(np.where(is_group_start, positions, -1))
+        # candles before the first group start count from the beginning and have no recent values
+        has_group = group_starts >= 0
+        group_start_positions = np.where(has_group, group_starts, 0)
+
+        local_df['recent_low'] = local_df['low'].take(group_start_positions).where(has_group).to_numpy()
+        local_df['recent_high'] = local_df['high'].take(group_start_positions).where(has_group).to_numpy()
+        local_df['recent_consolidation_start'] = local_df['date_time'].take(group_start_positions).where(has_group).to_numpy()
+        local_df['index'] = group_starts if has_group.all() else np.where(has_group, group_starts, np.nan)
+        local_df['candles_count'] = positions - group_starts
 
-        return pd.merge(
-            df,
-            candles_count_df,
-            how='left',
-            on=['date_time']
-        )
+        return local_df
 
     def with_is_signal(self, dataframe: DataFrame) -> DataFrame:
         local_df = dataframe.copy()
@@ -71,8 +58,8 @@ class Engulfing:
 
         return local_df
 
-    def analyze(self, dataframe: DataFrame) -> DataFrame:
-        return self.with_is_signal(self.apply_counting(self.with_check_column(dataframe)))
+    def analyze(self, dataframe: DataFrame | CandleFrame) -> DataFrame:
+        return self.with_is_signal(self.apply_counting(self.with_check_column(as_dataframe(dataframe))))
 
     def plot_chart(self, symbol, dataframe):
         return None
@@ -1,5 +1,7 @@
 from pandas import DataFrame
-import numpy as np
+
+from ea.misc.candle_frame import CandleFrame, as_dataframe
+from ea.strategies.indicators.rolling import get_rolling_extremes
 
 
 class EngulfingLoose:
@@ -11,42 +13,27 @@ class EngulfingLoose:
 
         local_df["idx"] = local_df.index.map(int)
 
-        local_df["recent_low"] = local_df.rolling(candles_count, min_periods=candles_count)["low"].apply(
-            lambda x: x.min()
-        )
-        local_df["lower_bound_idx"] = local_df.rolling(candles_count, min_periods=candles_count)["low"].apply(
-            lambda x: x.idxmin()
-        )
-
-        local_df["recent_high"] = local_df.rolling(candles_count, min_periods=candles_count)["high"].apply(
-            lambda x: x.max()
-        )
-        local_df["upper_bound_idx"] = local_df.rolling(candles_count, min_periods=candles_count)["high"].apply(
-            lambda x: x.idxmax()
-        )
-
-        non_nan = local_df[local_df['upper_bound_idx'].notnull()].copy()
-        non_nan["lower_bound_idx"] = non_nan['lower_bound_idx'].astype(int)
-        non_nan["upper_bound_idx"] = non_nan['upper_bound_idx'].astype(int)
+        # every window ends at its candle, the first candles_count - 1 candles have none
+        non_nan = local_df.iloc[candles_count - 1:].copy()
+        indices = local_df["idx"].to_numpy()
+        lower_bound_positions, non_nan["recent_low"] = get_rolling_extremes(local_df["low"], candles_count, is_minimum=True)
+        non_nan["lower_bound_idx"] = indices[lower_bound_positions]
+        upper_bound_positions, non_nan["recent_high"] = get_rolling_extremes(local_df["high"], candles_count, is_minimum=False)
+        non_nan["upper_bound_idx"] = indices[upper_bound_positions]
 
         # is_signal = true when local min/max are of the same candle and the candle happened candles_count ago
-        non_nan["is_signal"] = non_nan.apply(
-            lambda x: (x.lower_bound_idx == x.upper_bound_idx) & (x.idx - x.upper_bound_idx == candles_count - 1),
-            axis=1
-        )
+        non_nan["is_signal"] = (lower_bound_positions == upper_bound_positions) \
+            & (non_nan["idx"].to_numpy() - non_nan["upper_bound_idx"].to_numpy() == candles_count - 1)
 
-        non_nan["recent_consolidation_start"] = non_nan.apply(
-            lambda x: local_df.at[x.upper_bound_idx, "date_time"],
-            axis=1
-        )
+        non_nan["recent_consolidation_start"] = local_df["date_time"].take(upper_bound_positions).to_numpy()
 
         current_at = non_nan.date_time.max()
         non_nan['current_at'] = current_at
 
         return non_nan
 
-    def analyze(self, dataframe: DataFrame) -> DataFrame:
-        return self.with_is_signal(dataframe, int(self.settings['candles_count']))
+    def analyze(self, dataframe: DataFrame | CandleFrame) -> DataFrame:
+        return self.with_is_signal(as_dataframe(dataframe), int(self.settings['candles_count']))
 
     def plot_chart(self, symbol, dataframe):
         return None
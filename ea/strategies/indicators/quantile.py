@@ -0,0 +1,124 @@
+import math
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+
+import numpy as np
+
+
+def get_sorted_quantile(sorted_values: list, quantile: float) -> float:
+    # np.quantile 'linear' method, including its interpolation, so results are bit for bit the same
+    count = len(sorted_values)
+    if count == 0:
+        return math.nan
+
+    virtual_index = (count - 1) * quantile
+    if virtual_index >= count - 1:
+        return sorted_values[-1]
+
+    previous_index = math.floor(virtual_index)
+    previous_value = sorted_values[previous_index]
+    next_value = sorted_values[previous_index + 1]
+    gamma = virtual_index - previous_index
+    difference = next_value - previous_value
+
+    return next_value - difference * (1 - gamma) if gamma >= 0.5 else previous_value + difference * gamma
+
+
+class ExactQuantile:
+    def __init__(self, quantile: float, window: int = None):
+        self.quantile = quantile
+        self.window = window
+        self.values = deque()
+        self.sorted_values = []
+
+    def update(self, value: float):
+        if self.window is not None:
+            self.values.append(value)
+            if len(self.values) > self.window:
+                del self.sorted_values[bisect_left(self.sorted_values, self.values.popleft())]
+
+        insort(self.sorted_values, value)
+
+    def get(self) -> float:
+        return get_sorted_quantile(self.sorted_values, self.quantile)
+
+
+# https://www.cse.wustl.edu/~jain/papers/ftp/psqr.pdf
+class P2Quantile:
+    def __init__(self, quantile: float):
+        self.quantile = quantile
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired_positions = [1, 1 + 2 * quantile, 1 + 4 * quantile, 3 + 2 * quantile, 5]
+        self.increments = [0, quantile / 2, quantile, (1 + quantile) / 2, 1]
+
+    def get_parabolic(self, idx: int, step: int) -> float:
+        heights, positions = self.heights, self.positions
+        return heights[idx] + step / (positions[idx + 1] - positions[idx - 1]) * (
+            (positions[idx] - positions[idx - 1] + step) * (heights[idx + 1] - heights[idx]) / (positions[idx + 1] - positions[idx])
+            + (positions[idx + 1] - positions[idx] - step) * (heights[idx] - heights[idx - 1]) / (positions[idx] - positions[idx - 1])
+        )
+
+    def get_linear(self, idx: int, step: int) -> float:
+        heights, positions = self.heights, self.positions
+        return heights[idx] + step * (heights[idx + step] - heights[idx]) / (positions[idx + step] - positions[idx])
+
+    def update(self, value: float):
+        heights = self.heights
+        if len(heights) < 5:
+            insort(heights, value)
+            return
+
+        # cell of the new observation, extreme markers follow the min and max
+        if value < heights[0]:
+            heights[0] = value
+            cell = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            cell = 3
+        else:
+            cell = bisect_right(heights, value) - 1
+
+        for idx in range(cell + 1, 5):
+            self.positions[idx] += 1
+        for idx in range(5):
+            self.desired_positions[idx] += self.increments[idx]
+
+        # move middle markers which drifted off their desired positions
+        for idx in range(1, 4):
+            drift = self.desired_positions[idx] - self.positions[idx]
+            if (drift >= 1 and self.positions[idx + 1] - self.positions[idx] > 1) \
+                    or (drift <= -1 and self.positions[idx - 1] - self.positions[idx] < -1):
+                step = 1 if drift > 0 else -1
+                candidate = self.get_parabolic(idx, step)
+                if not heights[idx - 1] < candidate < heights[idx + 1]:
+                    candidate = self.get_linear(idx, step)
+                heights[idx] = candidate
+                self.positions[idx] += step
+
+    def get(self) -> float:
+        if len(self.heights) < 5:
+            return get_sorted_quantile(self.heights, self.quantile)
+
+        return self.heights[2]
+
+
+def get_quantile_estimator(estimator: str, quantile: float, window: int = None):
+    if estimator == 'exact':
+        return ExactQuantile(quantile, window)
+    if estimator == 'p2':
+        if window is not None:
+            raise ValueError('Rolling window is supported by the exact quantile estimator only')
+        return P2Quantile(quantile)
+
+    raise ValueError(f'Unknown quantile estimator: {estimator}')
+
+
+def get_running_quantiles(estimator, values: list) -> np.ndarray:
+    # quantile known at the time of every value - the value itself included
+    quantiles = np.empty(len(values))
+    for idx, value in enumerate(values):
+        estimator.update(value)
+        quantiles[idx] = estimator.get()
+
+    return quantiles
@@ -0,0 +1,58 @@
+from dataclasses import dataclass
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+@dataclass
+class RunningRegression:
+    # x runs over 1..count, y is kept relative to the first element so the sums stay small
+    origin: float = 0.0
+    count: int = 0
+    sum_x: int = 0
+    sum_y: float = 0.0
+    sum_xy: float = 0.0
+    sum_xx: int = 0
+
+    def reset(self, value: float):
+        self.origin = value
+        self.count = 1
+        self.sum_x = 1
+        self.sum_y = 0.0
+        self.sum_xy = 0.0
+        self.sum_xx = 1
+
+    def append(self, value: float):
+        if self.count == 0:
+            self.reset(value)
+            return
+
+        self.count += 1
+        x = self.count
+        y = value - self.origin
+
+        self.sum_x += x
+        self.sum_y += y
+        self.sum_xy += x * y
+        self.sum_xx += x * x
+
+    def get_beta(self) -> float:
+        denominator = self.count * self.sum_xx - self.sum_x * self.sum_x
+        if denominator == 0:
+            return 0
+
+        return (self.count * self.sum_xy - self.sum_x * self.sum_y) / denominator
+
+
+def get_rolling_betas(values, window: int) -> np.ndarray:
+    # slopes of the least squares lines over every window of consecutive values, x runs over 0..window - 1
+    values = np.asarray(values, dtype=float)
+    if window > len(values):
+        return np.empty(0)
+
+    centered_x = np.arange(window) - (window - 1) / 2
+    denominator = centered_x @ centered_x
+    if denominator == 0:
+        return np.zeros(len(values) - window + 1)
+
+    return sliding_window_view(values, window) @ centered_x / denominator
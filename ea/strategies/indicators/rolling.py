@@ -0,0 +1,50 @@
+from collections import deque
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+class RollingExtreme:
+    def __init__(self, window: int, is_minimum: bool):
+        self.window = window
+        self.is_minimum = is_minimum
+        # monotonic deque of (position, value), the extreme of the window is at the front
+        self.entries = deque()
+
+    def dominates(self, value: float, other: float) -> bool:
+        return value < other if self.is_minimum else value > other
+
+    def append(self, position: int, value: float):
+        # equal values stay, so the earliest one of the tied extremes is in front of the others
+        while self.entries and self.dominates(value, self.entries[-1][1]):
+            self.entries.pop()
+        self.entries.append((position, value))
+
+        while self.entries[0][0] <= position - self.window:
+            self.entries.popleft()
+
+    def get(self) -> float:
+        return self.entries[0][1]
+
+    def get_unique_entry(self, start: int):
+        # extreme among the positions from start onwards, None whenever another candle ties with it
+        entries = iter(self.entries)
+        for position, value in entries:
+            if position >= start:
+                following = next(entries, None)
+                return (position, value) if following is None or self.dominates(value, following[1]) else None
+
+        return None
+
+
+def get_rolling_extremes(values, window: int, is_minimum: bool):
+    # positions and values of the extreme of every window of consecutive values, the earliest one on ties
+    values = np.asarray(values, dtype=float)
+    if window > len(values):
+        return np.empty(0, dtype=int), np.empty(0)
+
+    windows = sliding_window_view(values, window)
+    offsets = windows.argmin(axis=1) if is_minimum else windows.argmax(axis=1)
+    positions = np.arange(len(windows)) + offsets
+
+    return positions, values[positions]
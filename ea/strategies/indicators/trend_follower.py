@@ -1,8 +1,42 @@
-from itertools import groupby
+from bisect import bisect_right
+from collections import deque
+from dataclasses import dataclass, field
+from itertools import groupby, product
 
 import numpy as np
-from pandas import DataFrame
-from scipy.signal import argrelmin, argrelmax
+import pandas as pd
+from pandas import DataFrame, Timestamp
+
+from ea.misc.candle_frame import CandleFrame, as_dataframe
+from ea.misc.checkpoint import load_checkpoint, save_checkpoint
+from ea.strategies.indicators.regression import get_rolling_betas
+from ea.strategies.indicators.rolling import RollingExtreme
+
+
+@dataclass
+class TrendFollowerState:
+    extreme_candles_range: int
+    beta_extreme_count: int
+    rolling_window: int
+    # order windows of the local extremes and windows of the lower/upper bounds
+    lows: RollingExtreme
+    highs: RollingExtreme
+    rolling_lows: RollingExtreme
+    rolling_highs: RollingExtreme
+    # date times of the candles which can still turn out to be an extreme
+    date_times: deque
+    # cleaned extreme values the next beta is calculated over
+    beta_values: deque
+    # the most recent cleaned extreme, a following one of the same side might still replace it
+    open_extreme: dict = None
+    market_analysis: list = field(default_factory=list)
+    # candles are numbered from the first one processed since the checkpoint was started
+    candles_count: int = 0
+    last_candle_at: Timestamp = None
+    # shifted rolling lower/upper bounds of the retained candles, the first one belongs to the rolling_start candle
+    rolling_start: int = 0
+    rolling_n_lows: list = field(default_factory=list)
+    rolling_n_highs: list = field(default_factory=list)
 
 
 class TrendFollower:
@@ -21,6 +55,9 @@ class TrendFollower:
         return waves
 
     def get_extremes(self, dataframe: DataFrame, extreme_candles_range: int):
+        # scipy.signal takes longer to import than the rest of a runner, the incremental mode does not need it
+        from scipy.signal import argrelmin, argrelmax
+
         # Find local extremes
         minima_idx_dirty = \
             argrelmin(dataframe['low'].values, order=extreme_candles_range)[0]
@@ -48,29 +85,18 @@ class TrendFollower:
 
         return extremes_cleaned
 
-    def calculate_beta_coefficients(self, length, arr):
-        x = np.arange(length)
-        y = np.array(arr)
-
-        # Calculate beta coefficient using polyfit
-        beta, _ = np.polyfit(x, y, 1)
-
-        return beta
-
     def get_betas(self, collection: list[dict], beta_extreme_count: int):
         # calculate beta coefficient of the consecutive extremes <current - n, current>
         beta_elements_count = beta_extreme_count
         extremes_indices = [element['idx'] for element in collection]
         extremes_sides = [element['side'] for element in collection]
         extremes_values = [element['extreme_value'] for element in collection]
+        rolling_betas = get_rolling_betas(extremes_values, beta_elements_count)
         betas = [
             dict(
                 idx=extremes_indices[i],
                 side=extremes_sides[i],
-                beta=self.calculate_beta_coefficients(
-                    beta_elements_count,
-                    extremes_values[i - beta_elements_count + 1:i + 1]
-                )
+                beta=rolling_betas[i - beta_elements_count + 1]
             ) for i in range(beta_elements_count - 1, len(extremes_indices))
         ]
 
@@ -79,11 +105,11 @@ class TrendFollower:
     def get_market_analysis(self, extremes: list[dict], betas: list[dict]):
         # combine both collections whenever index matches
         # assign beta coefficient of the consecutive extremes
+        betas_by_extreme = {(entry['idx'], entry['side']): entry for entry in betas}
         market_analysis = [
-            {**entry1, **entry2}
-            for entry1 in extremes
-            for entry2 in betas
-            if (entry1['idx'] == entry2['idx']) & (entry1['side'] == entry2['side'])
+            {**entry, **betas_by_extreme[(entry['idx'], entry['side'])]}
+            for entry in extremes
+            if (entry['idx'], entry['side']) in betas_by_extreme
         ]
 
         return market_analysis
@@ -99,32 +125,24 @@ class TrendFollower:
     def with_beta_sign(self, dataframe: DataFrame, collection: list[dict]):
         local_df = dataframe.copy()
         # Assign beta
-        market_analysis_indices = [element['idx'] for element in collection]
-        market_analysis_extreme_datetimes = [element['date_time'] for element in collection]
-        market_analysis_betas = [element['beta'] for element in collection]
-
-        for i in range(len(market_analysis_indices) - 1):
-            row_indexer = market_analysis_indices[i]
-            # i + 1 in next iteration becomes i, so data is overwritten
-            column_indexer = market_analysis_indices[i + 1]
-            beta_coefficient = market_analysis_betas[i]
-            # print(f'{row_indexer}: {column_indexer}')
-            # sp500_data.loc[row_indexer: column_indexer, 'beta_sign_original'] = np.sign(beta_coefficient)
-            #
-            # modifier = rolling_window - 1
-            # excluding local extreme itself
-            modifier = 1
-            local_df.loc[row_indexer + modifier: column_indexer, 'current_extreme_on'] = \
-                market_analysis_extreme_datetimes[i]
-            local_df.loc[row_indexer + modifier: column_indexer, 'beta_sign'] = np.sign(beta_coefficient)
-
-        # Extra step for data after the most recent extreme
-        recent_extreme_index = collection[-1]['idx']
-        recent_beta = market_analysis_betas[-1]
-        recent_extreme_on = collection[-1]['date_time']
-
-        local_df.loc[recent_extreme_index:, 'current_extreme_on'] = recent_extreme_on
-        local_df.loc[recent_extreme_index:, 'beta_sign'] = np.sign(recent_beta)
+        market_analysis_indices = np.array([element['idx'] for element in collection])
+        market_analysis_extreme_datetimes = pd.DatetimeIndex([element['date_time'] for element in collection])
+        market_analysis_beta_signs = np.sign([element['beta'] for element in collection])
+
+        # every extreme takes over the candles after it (excluding local extreme itself) until the next one takes over,
+        # the most recent one also takes over its own candle
+        modifier = 1
+        starts = np.r_[market_analysis_indices[:-1] + modifier, market_analysis_indices[-1]]
+        start_positions = local_df.index.searchsorted(starts)
+
+        candles_count = len(local_df)
+        in_range = start_positions < candles_count
+        extreme_numbers = np.full(candles_count, -1)
+        extreme_numbers[start_positions[in_range]] = np.arange(len(collection))[in_range]
+        extreme_numbers = np.maximum.accumulate(extreme_numbers)
+
+        local_df['current_extreme_on'] = market_analysis_extreme_datetimes.take(extreme_numbers, allow_fill=True, fill_value=pd.NaT)
+        local_df['beta_sign'] = np.where(extreme_numbers >= 0, market_analysis_beta_signs[extreme_numbers], np.nan)
 
         return local_df
 
@@ -168,8 +186,8 @@ class TrendFollower:
 
         return local_df
 
-    def analyze(self, dataframe: DataFrame) -> DataFrame:
-        local_df = dataframe.copy()
+    def analyze(self, dataframe: DataFrame | CandleFrame) -> DataFrame:
+        local_df = as_dataframe(dataframe).copy()
         # parameters
         extreme_candles_range = int(self.settings['extreme_candles_range'])
         beta_extreme_count = int(self.settings['beta_extreme_count'])
@@ -191,6 +209,220 @@ class TrendFollower:
 
         return with_applied_is_signal
 
+    def analyze_sweep(self, dataframe: DataFrame | CandleFrame, extreme_candles_ranges: list, beta_extreme_counts: list,
+                      rolling_windows: list) -> DataFrame:
+        local_df = as_dataframe(dataframe).copy()
+        # extremes only depend on extreme_candles_range and the bounds on rolling_window, both are shared
+        extremes = {
+            extreme_candles_range: self.get_extremes(local_df, int(extreme_candles_range))
+            for extreme_candles_range in extreme_candles_ranges
+        }
+        with_rolling_attributes = {
+            rolling_window: self.with_rolling_attributes(local_df, int(rolling_window))
+            for rolling_window in rolling_windows
+        }
+
+        results = {}
+        for extreme_candles_range, beta_extreme_count in product(extreme_candles_ranges, beta_extreme_counts):
+            betas = self.get_betas(extremes[extreme_candles_range], int(beta_extreme_count))
+            market_analysis = self.get_market_analysis(extremes[extreme_candles_range], betas)
+            beta_sign_df = self.with_beta_sign(local_df, market_analysis)
+
+            for rolling_window in rolling_windows:
+                with_applied_beta_sign = with_rolling_attributes[rolling_window].assign(
+                    current_extreme_on=beta_sign_df['current_extreme_on'],
+                    beta_sign=beta_sign_df['beta_sign']
+                )
+
+                with_applied_indicator = self.with_indicator(with_applied_beta_sign)
+
+                results[(extreme_candles_range, beta_extreme_count, rolling_window)] = self.with_is_signal(with_applied_indicator)
+
+        return pd.concat(results, names=['extreme_candles_range', 'beta_extreme_count', 'rolling_window'])
+
+    def get_new_state(self, extreme_candles_range: int, beta_extreme_count: int, rolling_window: int) -> TrendFollowerState:
+        return TrendFollowerState(
+            extreme_candles_range=extreme_candles_range,
+            beta_extreme_count=beta_extreme_count,
+            rolling_window=rolling_window,
+            lows=RollingExtreme(2 * extreme_candles_range + 1, is_minimum=True),
+            highs=RollingExtreme(2 * extreme_candles_range + 1, is_minimum=False),
+            rolling_lows=RollingExtreme(rolling_window, is_minimum=True),
+            rolling_highs=RollingExtreme(rolling_window, is_minimum=False),
+            date_times=deque(maxlen=extreme_candles_range + 1),
+            beta_values=deque(maxlen=beta_extreme_count - 1)
+        )
+
+    def close_extreme(self, state: TrendFollowerState, extreme: dict):
+        values = [*state.beta_values, extreme['extreme_value']]
+        if len(values) == state.beta_extreme_count:
+            state.market_analysis.append({**extreme, 'beta': get_rolling_betas(values, state.beta_extreme_count)[0]})
+        state.beta_values.append(extreme['extreme_value'])
+
+    def append_extreme(self, state: TrendFollowerState, extreme: dict):
+        cleaned_extremes = self.clean_extremes([state.open_extreme, extreme]) \
+            if state.open_extreme is not None \
+            else [extreme]
+        if len(cleaned_extremes) == 2:
+            self.close_extreme(state, cleaned_extremes[0])
+        state.open_extreme = cleaned_extremes[-1]
+
+    def process_candles(self, state: TrendFollowerState, dataframe: DataFrame):
+        extreme_candles_range = state.extreme_candles_range
+        date_times = dataframe['date_time'].array
+        lows = dataframe['low'].to_numpy(dtype=float)
+        highs = dataframe['high'].to_numpy(dtype=float)
+
+        for date_time, low, high in zip(date_times, lows.tolist(), highs.tolist()):
+            position = state.candles_count
+            # bounds of the previous rolling_window candles
+            is_rolling_window_full = position >= state.rolling_window
+            state.rolling_n_lows.append(state.rolling_lows.get() if is_rolling_window_full else np.nan)
+            state.rolling_n_highs.append(state.rolling_highs.get() if is_rolling_window_full else np.nan)
+            state.rolling_lows.append(position, low)
+            state.rolling_highs.append(position, high)
+
+            state.lows.append(position, low)
+            state.highs.append(position, high)
+            state.date_times.append(date_time)
+            state.candles_count += 1
+
+            # the whole order window of the candle extreme_candles_range back is known now
+            # (the first candle is never an extreme - argrelextrema clips the window at the edges)
+            extreme_position = position - extreme_candles_range
+            if extreme_position < 1:
+                continue
+            for side, window in [('at_low', state.lows), ('at_high', state.highs)]:
+                entry = window.get_unique_entry(extreme_position - extreme_candles_range)
+                if entry is not None and entry[0] == extreme_position:
+                    self.append_extreme(state, dict(
+                        idx=extreme_position,
+                        date_time=state.date_times[0],
+                        side=side,
+                        extreme_value=entry[1]
+                    ))
+
+        if len(dataframe) != 0:
+            state.last_candle_at = date_times[-1]
+
+        return state
+
+    @staticmethod
+    def get_provisional_extremes(state: TrendFollowerState) -> list[dict]:
+        # argrelextrema clips the order window at the last candle, so the most recent candles might be extremes for now
+        extreme_candles_range = state.extreme_candles_range
+        last_position = state.candles_count - 1
+        first_position = max(last_position - extreme_candles_range + 1, 1)
+
+        extremes = []
+        for side, window in [('at_low', state.lows), ('at_high', state.highs)]:
+            candidates = [position for position, _ in window.entries if first_position <= position < last_position]
+            for position in candidates:
+                entry = window.get_unique_entry(position - extreme_candles_range)
+                if entry is not None and entry[0] == position:
+                    extremes.append(dict(
+                        idx=position,
+                        date_time=state.date_times[position - last_position - 1],
+                        side=side,
+                        extreme_value=entry[1]
+                    ))
+                    break
+
+        return sorted(extremes, key=lambda x: x['idx'])
+
+    def get_incremental_market_analysis(self, state: TrendFollowerState) -> list[dict]:
+        open_extremes = [state.open_extreme] if state.open_extreme is not None else []
+        tail = self.clean_extremes(open_extremes + self.get_provisional_extremes(state))
+
+        # betas belong to the most recent values, the earliest extremes might lack the predecessors
+        values = [*state.beta_values, *[extreme['extreme_value'] for extreme in tail]]
+        betas = get_rolling_betas(values, state.beta_extreme_count)
+        tail_with_betas = [{**extreme, 'beta': beta} for extreme, beta in zip(tail[::-1], betas[::-1])][::-1]
+
+        return state.market_analysis + tail_with_betas
+
+    @staticmethod
+    def trim_state(state: TrendFollowerState, history_start: int):
+        # later histories start no earlier, the candle before the current one is the first that is needed
+        retained_start = max(history_start - 1, 0)
+        del state.rolling_n_lows[:retained_start - state.rolling_start]
+        del state.rolling_n_highs[:retained_start - state.rolling_start]
+        state.rolling_start = retained_start
+
+        # every candle belongs to the most recent extreme before it
+        extremes_before = bisect_right([extreme['idx'] for extreme in state.market_analysis], retained_start - 1)
+        state.market_analysis = state.market_analysis[max(extremes_before - 1, 0):]
+
+    def get_state(self, dataframe: DataFrame, checkpoint_path: str) -> TrendFollowerState:
+        new_state = self.get_new_state(
+            int(self.settings['extreme_candles_range']),
+            int(self.settings['beta_extreme_count']),
+            int(self.settings['rolling_window'])
+        )
+        settings = ['extreme_candles_range', 'beta_extreme_count', 'rolling_window']
+        state = load_checkpoint(checkpoint_path)
+
+        if state is None or state.last_candle_at is None or any(getattr(state, name) != getattr(new_state, name) for name in settings):
+            return new_state
+        if state.last_candle_at < dataframe['date_time'].iloc[0]:
+            # candles between the checkpoint and the current history are missing, start over
+            return new_state
+        history_start = state.candles_count - (dataframe['date_time'] <= state.last_candle_at).sum()
+        if history_start < 0 or max(history_start - 1, 0) < state.rolling_start:
+            # the current history reaches further back than the checkpoint does
+            return new_state
+
+        return state
+
+    def with_incremental_signals(self, dataframe: DataFrame, state: TrendFollowerState, history_start: int) -> DataFrame:
+        local_df = dataframe.copy()
+        # the candle before the history goes along, it gives the first indicator_lead
+        first_position = max(history_start - 1, 0)
+        leading_count = history_start - first_position
+        leading_values = np.full(leading_count, np.nan)
+        retained_offset = first_position - state.rolling_start
+
+        signals_df = DataFrame(
+            dict(
+                low=np.r_[leading_values, local_df['low'].to_numpy(dtype=float)],
+                high=np.r_[leading_values, local_df['high'].to_numpy(dtype=float)],
+                rolling_n_low=state.rolling_n_lows[retained_offset:],
+                rolling_n_high=state.rolling_n_highs[retained_offset:]
+            ),
+            index=pd.RangeIndex(first_position, state.candles_count)
+        )
+
+        market_analysis = self.get_incremental_market_analysis(state)
+
+        with_applied_beta_sign = self.with_beta_sign(signals_df, market_analysis)
+
+        with_applied_indicator = self.with_indicator(with_applied_beta_sign)
+
+        with_applied_is_signal = self.with_is_signal(with_applied_indicator)
+
+        for column in with_applied_is_signal.columns.drop(['low', 'high']):
+            local_df[column] = with_applied_is_signal[column].to_numpy()[leading_count:]
+
+        return local_df
+
+    def analyze_incremental(self, dataframe: DataFrame | CandleFrame, checkpoint_path: str) -> DataFrame:
+        local_df = as_dataframe(dataframe).copy()
+        state = self.get_state(local_df, checkpoint_path)
+
+        new_candles_df = local_df[local_df['date_time'] > state.last_candle_at] \
+            if state.last_candle_at is not None \
+            else local_df
+        history_start = state.candles_count - (len(local_df) - len(new_candles_df))
+
+        # the most recent candle might not be closed yet - it is taken into account but never checkpointed
+        self.process_candles(state, new_candles_df.iloc[:-1])
+        self.trim_state(state, history_start)
+        save_checkpoint(checkpoint_path, state)
+
+        self.process_candles(state, new_candles_df.iloc[-1:])
+
+        return self.with_incremental_signals(local_df, state, history_start)
+
     def plot_chart(self, symbol, dataframe):
         return None
 
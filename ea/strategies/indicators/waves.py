@@ -1,8 +1,27 @@
-import numpy as np
+from dataclasses import dataclass, field, replace
+
 import pandas as pd
-import plotly.graph_objects as go
-from pandas import DataFrame
-from plotly.subplots import make_subplots
+from pandas import DataFrame, Timestamp
+
+from ea.misc.candle_frame import CandleFrame, as_dataframe
+from ea.misc.checkpoint import load_checkpoint, save_checkpoint
+from ea.strategies.indicators.regression import RunningRegression
+
+
+@dataclass
+class WavesState:
+    segment_columns = ['date_time', 'close', 'high', 'low']
+
+    distance: float
+    market: str = None
+    current_extremum: float = None
+    current_extremum_break: float = None
+    starting_index: int = 0
+    regression: RunningRegression = field(default_factory=RunningRegression)
+    # candles of the wave which is not closed yet
+    segment: DataFrame = None
+    last_candle_at: Timestamp = None
+    waves: list = field(default_factory=list)
 
 
 class Waves:
@@ -30,192 +49,248 @@ class Waves:
     def info_on_candidate(self):
         pass
 
-    def get_wave_candle(self, side, dataframe: DataFrame):
-        # instead of copy
-        dicts = dataframe.to_dict('records')
-        local_df = pd.DataFrame(dicts)
-
-        sorted_df = local_df.sort_values(by=['date_time'], ascending=False)
+    def get_wave_candle(self, side, starting_index: int, ending_index: int, date_times, closes, highs, lows):
+        # segment <starting_index, ending_index> is searched backwards so the most recent candle wins on ties
+        reversed_slice_end = starting_index - 1 if starting_index > 0 else None
 
         data = None
         if side == 'bullish':
             # search for local max
-            column_high = sorted_df['high']
-            index = column_high.idxmax()
+            index = ending_index - highs[ending_index:reversed_slice_end:-1].argmax()
 
-            candle = local_df.iloc[index].to_dict()
             data = dict(
-                date_time=sorted_df['date_time'].iloc[0],
-                confirmation_price=sorted_df['close'].iloc[0],
-                break_time=candle['date_time'],
-                break_value=candle['high'],
+                date_time=date_times[ending_index],
+                confirmation_price=closes[ending_index],
+                break_time=date_times[index],
+                break_value=highs[index],
                 market='bearish'
             )
 
         elif side == 'bearish':
             # search for local min
-            column_low = sorted_df['low']
-            index = column_low.idxmin()
+            index = ending_index - lows[ending_index:reversed_slice_end:-1].argmin()
 
-            candle = local_df.iloc[index].to_dict()
             data = dict(
-                date_time=sorted_df['date_time'].iloc[0],
-                confirmation_price=sorted_df['close'].iloc[0],
-                break_time=candle['date_time'],
-                break_value=candle['low'],
+                date_time=date_times[ending_index],
+                confirmation_price=closes[ending_index],
+                break_time=date_times[index],
+                break_value=lows[index],
                 market='bullish'
             )
 
         return data
 
-    def get_waves(self, dataframe, distance):
-        copied_df = dataframe.copy()
-        collection = dataframe.to_dict('index')
-
-        wave_candles = []
-
-        market = None
-
-        starting_index = 0
-
-        regression_elements = []
-
-        current_extremum = None
-        current_extremum_break = None
-
-        for key in collection:
+    @staticmethod
+    def get_move(state: WavesState, current_low: float, current_high: float, current_close: float, beta: float):
+        # reversals checked against the distance come with the excess which has to be greater than the distance
+        if state.current_extremum is None:
+            return ('start_high' if beta > 0 else 'start_low'), None
+
+        if (beta > 0) & (current_high > state.current_extremum) & (current_close > state.current_extremum_break):
+            return 'bullish', None
+        if (beta > 0) & (state.market == 'bullish'):
+            if current_close < state.current_extremum_break:
+                return 'bullish_reversal', None
+            return 'bullish_reversal', state.current_extremum - current_close
+        if (beta < 0) & (current_low < state.current_extremum) & (current_close < state.current_extremum_break):
+            return 'bearish', None
+        if (beta < 0) & (state.market == 'bearish'):
+            if current_close > state.current_extremum_break:
+                return 'bearish_reversal', None
+            return 'bearish_reversal', current_close - state.current_extremum
+
+        return None, None
+
+    def apply_move(self, state: WavesState, move: str, key: int, current_low: float, current_high: float,
+                   medium_value: float, date_times, closes, highs, lows):
+        closes_wave = (move in ['bullish_reversal', 'bearish_reversal']) \
+            | ((move == 'bullish') & (state.market == 'bearish')) \
+            | ((move == 'bearish') & (state.market == 'bullish'))
+
+        wave_candle = None
+        if closes_wave:
+            wave_candle = self.get_wave_candle(state.market, state.starting_index, key, date_times, closes, highs, lows)
+
+            state.starting_index = key
+            state.regression.reset(medium_value)
+
+            self.info_on_candidate()
+
+        if move in ['start_high', 'bullish', 'bearish_reversal']:
+            state.current_extremum = current_high
+            state.current_extremum_break = current_low
+        else:
+            state.current_extremum = current_low
+            state.current_extremum_break = current_high
+
+        if move in ['bullish', 'bearish_reversal']:
+            state.market = 'bullish'
+        elif move in ['bearish', 'bullish_reversal']:
+            state.market = 'bearish'
+
+        return wave_candle
+
+    def process_candles(self, state: WavesState, dataframe: DataFrame):
+        # candles of the open wave go first, so starting_index points into the same arrays as in a full run
+        candles_df = dataframe[WavesState.segment_columns]
+        segment_df = state.segment if state.segment is not None else candles_df.iloc[:0]
+        segment_with_candles_df = pd.concat([segment_df, candles_df], ignore_index=True) \
+            if state.segment is not None \
+            else candles_df.reset_index(drop=True)
+
+        date_times = segment_with_candles_df['date_time'].array
+        closes = segment_with_candles_df['close'].to_numpy(dtype=float)
+        highs = segment_with_candles_df['high'].to_numpy(dtype=float)
+        lows = segment_with_candles_df['low'].to_numpy(dtype=float)
+        candles = zip(lows[len(segment_df):].tolist(), highs[len(segment_df):].tolist(), closes[len(segment_df):].tolist())
+
+        for key, (current_low, current_high, current_close) in enumerate(candles, start=len(segment_df)):
             # establish current trend
-            # current_date = collection[key]['date_time']
-
-            current_low = collection[key]['low']
-            current_high = collection[key]['high']
-            current_close = collection[key]['close']
             medium_value = current_high - (current_high - current_low) / 2
 
-            regression_elements.append(medium_value)
-            regression_elements_count = len(regression_elements)
+            state.regression.append(medium_value)
+            beta = state.regression.get_beta()
+
+            move, excess = self.get_move(state, current_low, current_high, current_close, beta)
+            if (move is None) or ((excess is not None) and not (excess > state.distance)):
+                continue
 
-            beta = self.get_beta(
-                x=np.arange(1, (regression_elements_count + 1)),
-                y=np.array(regression_elements)
-            )[1]
+            wave_candle = self.apply_move(state, move, key, current_low, current_high, medium_value, date_times, closes, highs, lows)
+            if wave_candle is not None:
+                state.waves.append(wave_candle)
 
-            if current_extremum is not None:
-                if (beta > 0) & (current_high > current_extremum) & (current_close > current_extremum_break):
-                    if market == 'bearish':
-                        wave_candles.append(self.get_wave_candle(market, copied_df.iloc[starting_index:(key + 1)]))
+        state.segment = segment_with_candles_df.iloc[state.starting_index:].reset_index(drop=True)
+        state.starting_index = 0
+        if len(candles_df) != 0:
+            state.last_candle_at = candles_df['date_time'].iloc[-1]
 
-                        starting_index = key
-                        regression_elements = [medium_value]
+        return state
 
-                        self.info_on_candidate()
+    def get_waves(self, dataframe, distance):
+        state = self.process_candles(WavesState(distance=distance), dataframe)
 
-                    market = 'bullish'
+        return pd.DataFrame(state.waves)
 
-                    current_extremum = current_high
-                    current_extremum_break = current_low
-                elif (beta > 0) & (market == 'bullish') & (
-                        ((current_high > current_extremum) & (current_close < current_extremum_break))
-                        | (current_close < current_extremum_break)
-                        | (current_extremum - current_close > distance)):
-                    current_extremum = current_low
-                    current_extremum_break = current_high
+    @staticmethod
+    def merge_groups(groups: list, key: int) -> list:
+        # machines which closed a wave on the same candle into the same position continue identically
+        merged_groups = []
+        positions = {}
+        for distances, state in groups:
+            if state.starting_index != key:
+                merged_groups.append((distances, state))
+                continue
+
+            position = (state.market, state.current_extremum, state.current_extremum_break)
+            if position in positions:
+                positions[position][0].extend(distances)
+                positions[position][0].sort()
+            else:
+                positions[position] = (list(distances), state)
+                merged_groups.append(positions[position])
+
+        return merged_groups
+
+    def get_waves_sweep(self, dataframe, distances: list) -> dict:
+        date_times = dataframe['date_time'].array
+        closes = dataframe['close'].to_numpy(dtype=float)
+        highs = dataframe['high'].to_numpy(dtype=float)
+        lows = dataframe['low'].to_numpy(dtype=float)
+        medium_values = highs - (highs - lows) / 2
+        candles = zip(lows.tolist(), highs.tolist(), closes.tolist(), medium_values.tolist())
+
+        waves = {distance: [] for distance in distances}
+        # distances are advanced together as long as their state machines are at the same position
+        groups = [(sorted(waves), WavesState(distance=None))]
+        for key, (current_low, current_high, current_close, medium_value) in enumerate(candles):
+            advanced_groups = []
+            for group_distances, state in groups:
+                state.regression.append(medium_value)
+                beta = state.regression.get_beta()
+
+                move, excess = self.get_move(state, current_low, current_high, current_close, beta)
+                if move is None:
+                    advanced_groups.append((group_distances, state))
+                    continue
+
+                if excess is not None:
+                    # distances are sorted, the smallest ones reverse the wave
+                    staying_distances = [distance for distance in group_distances if not excess > distance]
+                    if len(staying_distances) == len(group_distances):
+                        advanced_groups.append((group_distances, state))
+                        continue
+                    if len(staying_distances) != 0:
+                        staying_state = replace(state, regression=replace(state.regression))
+                        advanced_groups.append((staying_distances, staying_state))
+                    group_distances = group_distances[:len(group_distances) - len(staying_distances)]
+
+                wave_candle = self.apply_move(state, move, key, current_low, current_high, medium_value, date_times, closes, highs, lows)
+                if wave_candle is not None:
+                    for distance in group_distances:
+                        waves[distance].append(wave_candle)
+                advanced_groups.append((group_distances, state))
+
+            groups = self.merge_groups(advanced_groups, key)
+
+        return {distance: pd.DataFrame(wave_candles) for distance, wave_candles in waves.items()}
 
-                    wave_candles.append(self.get_wave_candle(market, copied_df.iloc[starting_index:(key + 1)]))
+    @staticmethod
+    def with_waves(dataframe: DataFrame, waves_df: DataFrame) -> DataFrame:
+        # final result
+        with_waves_df = None
+        waves_history = len(waves_df)
+        if waves_history != 0:
+            with_waves_df = pd.merge(dataframe, waves_df, how='left')
 
-                    starting_index = key
-                    regression_elements = [medium_value]
+        return with_waves_df
 
-                    market = 'bearish'
+    def analyze(self, dataframe: DataFrame | CandleFrame) -> DataFrame:
+        local_df = as_dataframe(dataframe).copy()
 
-                    self.info_on_candidate()
-                elif (beta < 0) & (current_low < current_extremum) & (current_close < current_extremum_break):
-                    if market == 'bullish':
-                        wave_candles.append(self.get_wave_candle(market, copied_df.iloc[starting_index:(key + 1)]))
+        waves_df = self.get_waves(dataframe=local_df, distance=self.settings['distance'])
 
-                        starting_index = key
-                        regression_elements = [medium_value]
+        return self.with_waves(local_df, waves_df)
 
-                        self.info_on_candidate()
+    def analyze_sweep(self, dataframe: DataFrame | CandleFrame, distances: list) -> dict:
+        local_df = as_dataframe(dataframe).copy()
 
-                    market = 'bearish'
+        waves_dfs = self.get_waves_sweep(dataframe=local_df, distances=distances)
 
-                    current_extremum = current_low
-                    current_extremum_break = current_high
-                elif (beta < 0) & (market == 'bearish') & (
-                        ((current_low < current_extremum) & (current_close > current_extremum_break))
-                        | (current_close > current_extremum_break)
-                        | (current_close - current_extremum > distance)):
-                    current_extremum = current_high
-                    current_extremum_break = current_low
+        return {distance: self.with_waves(local_df, waves_df) for distance, waves_df in waves_dfs.items()}
 
-                    wave_candles.append(self.get_wave_candle(market, copied_df.iloc[starting_index:key + 1]))
+    def get_state(self, dataframe: DataFrame, checkpoint_path: str) -> WavesState:
+        distance = self.settings['distance']
+        state = load_checkpoint(checkpoint_path)
 
-                    starting_index = key
-                    regression_elements = [medium_value]
+        if state is None or state.distance != distance:
+            return WavesState(distance=distance)
+        if state.last_candle_at is not None and state.last_candle_at < dataframe['date_time'].iloc[0]:
+            # candles between the checkpoint and the current history are missing, start over
+            return WavesState(distance=distance)
 
-                    market = 'bullish'
+        return state
 
-                    self.info_on_candidate()
-                else:
-                    pass  # print("Somehow here")
-            else:
-                if beta > 0:
-                    current_extremum = current_high
-                    current_extremum_break = current_low
-                else:
-                    current_extremum = current_low
-                    current_extremum_break = current_high
+    def analyze_incremental(self, dataframe: DataFrame | CandleFrame, checkpoint_path: str) -> DataFrame:
+        local_df = as_dataframe(dataframe).copy()
+        state = self.get_state(local_df, checkpoint_path)
 
-        return pd.DataFrame(wave_candles)
+        new_candles_df = local_df[local_df['date_time'] > state.last_candle_at] \
+            if state.last_candle_at is not None \
+            else local_df
 
-    def analyze(self, dataframe: DataFrame) -> DataFrame:
-        local_df = dataframe.copy()
+        # the most recent candle might not be closed yet - it is taken into account but never checkpointed
+        self.process_candles(state, new_candles_df.iloc[:-1])
+        state.waves = [wave for wave in state.waves if wave['date_time'] >= local_df['date_time'].iloc[0]]
+        save_checkpoint(checkpoint_path, state)
 
-        waves_df = self.get_waves(dataframe=local_df, distance=self.settings['distance'])
-        # final result
-        with_waves_df = None
-        waves_history = len(waves_df)
-        if waves_history != 0:
-            with_waves_df = pd.merge(local_df, waves_df, how='left')
+        self.process_candles(state, new_candles_df.iloc[-1:])
 
-        return with_waves_df
+        return self.with_waves(local_df, pd.DataFrame(state.waves))
 
     @staticmethod
     def plot_chart(symbol, dataframe):
+        # charts are not drawn, kept for run_scenario callers passing it as plot_func
         return None
-        draw_df = dataframe.copy()
-
-        fig = make_subplots(rows=1, cols=1, shared_xaxes=True, specs=[[{"secondary_y": True}]])
-        fig.add_trace(go.Candlestick(x=draw_df["date_time"],
-                                     open=draw_df["open"],
-                                     high=draw_df["high"],
-                                     low=draw_df["low"],
-                                     close=draw_df["close"],
-                                     name=symbol),
-                      secondary_y=True)
-
-        fig.update_layout(xaxis_rangeslider_visible=False)
-
-        fig.add_trace(
-            go.Scatter(
-                x=draw_df["break_time"],
-                y=draw_df["break_value"],
-                mode='lines+markers',
-                line=dict(color='black', width=2),
-                connectgaps=True,
-                name="waves"
-            ),
-            secondary_y=True
-        )
-
-        fig.add_trace(go.Bar(
-            x=draw_df['date_time'],
-            y=draw_df['volume']),
-            secondary_y=False)
-        fig.layout.yaxis2.showgrid = False
-
-        fig.show()
 
     def run_scenario(self, dataframe, symbol, plot_func=None) -> DataFrame:
         result_df = self.analyze(dataframe)
@@ -1,22 +1,31 @@
+import asyncio
+import random
 import time
 
 from ea.misc.logger import logger
 
 
-def retry(exception, retries=3, backoff_in_seconds=2):
+def async_retry(exception, retries=None, deadline_in_seconds=10, interval_in_seconds=0.1, max_interval_in_seconds=1):
+    # awaits the coroutine until it stops raising exception, runs out of retries or the deadline passes, the waits between the attempts
+    # double from interval up to max_interval with half of each one jittered, so concurrent pollers spread out
     def decorator(f):
-        def wrapper(*args, **kwargs):
+        async def wrapper(*args, **kwargs):
+            started_at = time.monotonic()
             attempt = 1
             while True:
-                logger.info(f'Attempting to open order, attempt no: {attempt}')
+                attempt_started_at = time.monotonic()
                 try:
-                    return f(*args, **kwargs)
-                except exception:
-                    if attempt == retries:
+                    result = await f(*args, **kwargs)
+                    logger.info(f'{f.__name__} attempt no: {attempt} succeeded in {time.monotonic() - attempt_started_at:.3f}s')
+                    return result
+                except exception as e:
+                    logger.info(f'{f.__name__} attempt no: {attempt} failed in {time.monotonic() - attempt_started_at:.3f}s: {e}')
+                    remaining = deadline_in_seconds - (time.monotonic() - started_at)
+                    if attempt == retries or remaining <= 0:
                         raise
 
-                    sleep = backoff_in_seconds * 2 ** attempt
-                    time.sleep(sleep)
+                    interval = min(interval_in_seconds * 2 ** (attempt - 1), max_interval_in_seconds)
+                    await asyncio.sleep(min(interval / 2 + random.uniform(0, interval / 2), remaining))
                     attempt += 1
 
         return wrapper
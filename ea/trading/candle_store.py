@@ -0,0 +1,133 @@
+import fcntl
+import json
+import os
+from contextlib import contextmanager
+
+import numpy as np
+
+from ea.misc.logger import logger
+
+
+class CandleStore:
+    # one raw file per column, rows are appended in time order; meta.json tells how many of them are complete
+    columns = {
+        'timestamp': np.int64,
+        'open': np.float64,
+        'close': np.float64,
+        'high': np.float64,
+        'low': np.float64,
+        'volume': np.float64
+    }
+
+    def __init__(self, directory: str, symbol: str, period: int):
+        self.path = os.path.join(directory, f'{symbol}-{period}')
+
+    def get_column_path(self, column: str) -> str:
+        return os.path.join(self.path, f'{column}.bin')
+
+    def get_meta_path(self) -> str:
+        return os.path.join(self.path, 'meta.json')
+
+    @contextmanager
+    def lock(self):
+        # exclusive across the processes of the host, whoever holds it fetches while the others wait for its candles
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, 'lock'), 'w') as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            yield
+
+    def load_meta(self) -> dict:
+        meta_path = self.get_meta_path()
+        if not os.path.exists(meta_path):
+            return None
+
+        try:
+            with open(meta_path) as file:
+                meta = json.load(file)
+            # a write interrupted after truncating the columns leaves them shorter than the count
+            for column, dtype in self.columns.items():
+                if os.path.getsize(self.get_column_path(column)) < meta['count'] * np.dtype(dtype).itemsize:
+                    raise ValueError(f'{column} column is shorter than {meta["count"]} candles')
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f'Ignoring unreadable candle store {self.path}: {e}')
+            return None
+
+        return meta
+
+    def save_meta(self, meta: dict):
+        # write aside and swap, readers never see a count the column files do not have yet
+        meta_path = self.get_meta_path()
+        temporary_path = f'{meta_path}.tmp'
+        with open(temporary_path, 'w') as file:
+            json.dump(meta, file)
+        os.replace(temporary_path, meta_path)
+
+    def get_count(self) -> int:
+        meta = self.load_meta()
+
+        return meta['count'] if meta is not None else 0
+
+    def read(self, limit: int = None) -> dict:
+        # memory mapped columns of the most recent limit candles, nothing is loaded until the values are used
+        count = self.get_count()
+        start = max(count - limit, 0) if limit is not None else 0
+        if count == 0:
+            return {column: np.empty(0, dtype=dtype) for column, dtype in self.columns.items()}
+
+        return {
+            column: np.memmap(self.get_column_path(column), dtype=dtype, mode='r', shape=(count,))[start:]
+            for column, dtype in self.columns.items()
+        }
+
+    def get_last_timestamp(self):
+        timestamps = self.read(limit=1)['timestamp']
+
+        return int(timestamps[-1]) if len(timestamps) != 0 else None
+
+    def write(self, candles: dict, history_size: int = None, replace: bool = False, updated_at: int = None):
+        # replacing drops the stored candles only, whatever else the meta tells is kept
+        meta = self.load_meta() or dict(count=0)
+        timestamps = np.asarray(candles['timestamp'], dtype=np.int64)
+        if replace:
+            kept_count = 0
+        elif meta['count'] != 0 and len(timestamps) != 0:
+            # stored candles from the first written timestamp on are replaced, the most recent one might not have been closed
+            kept_count = int(np.searchsorted(self.read()['timestamp'], timestamps[0]))
+        else:
+            kept_count = meta['count']
+
+        os.makedirs(self.path, exist_ok=True)
+        for column, dtype in self.columns.items():
+            values = np.ascontiguousarray(candles[column], dtype=dtype).tobytes()
+            column_path = self.get_column_path(column)
+            if kept_count == 0:
+                # whole columns are written aside and swapped in
+                temporary_path = f'{column_path}.tmp'
+                with open(temporary_path, 'wb') as file:
+                    file.write(values)
+                os.replace(temporary_path, column_path)
+            else:
+                # only the replaced tail is rewritten, readers copy what they need under the lock
+                with open(column_path, 'r+b') as file:
+                    file.truncate(kept_count * np.dtype(dtype).itemsize)
+                    file.seek(0, os.SEEK_END)
+                    file.write(values)
+
+        meta['count'] = kept_count + len(timestamps)
+        if history_size is not None:
+            meta['history_size'] = history_size
+        if updated_at is not None:
+            meta['updated_at'] = updated_at
+        self.save_meta(meta)
+
+    def merge(self, candles: dict):
+        # candles of any time range go among the stored ones, on equal timestamps the given ones win
+        stored = self.read()
+        merged = {
+            column: np.concatenate([stored[column], np.asarray(candles[column], dtype=dtype)])
+            for column, dtype in self.columns.items()
+        }
+        last_positions = np.unique(merged['timestamp'][::-1], return_index=True)[1]
+        positions = len(merged['timestamp']) - 1 - last_positions
+
+        self.write({column: values[positions] for column, values in merged.items()}, replace=True)
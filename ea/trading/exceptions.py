@@ -2,3 +2,15 @@ class TransactionStatusException(Exception):
     def __init__(self, message):
         self.message = message
         super().__init__(self.message)
+
+
+class TransactionPendingException(Exception):
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
+
+
+class CommandStatusException(Exception):
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
@@ -1,10 +1,15 @@
+import asyncio
+import threading
 from dataclasses import dataclass
 from datetime import datetime
-from datetime import timedelta
 
+import numpy as np
+
+from ea.misc.candle_frame import CandleFrame
 from ea.misc.logger import logger
-from ea.trading.backoff import retry
-from ea.trading.exceptions import TransactionStatusException
+from ea.trading.backoff import async_retry
+from ea.trading.candle_store import CandleStore
+from ea.trading.exceptions import TransactionPendingException, TransactionStatusException
 from ea.trading.order import OrderMode, OrderWrapper
 from pandas import DataFrame
 from xtb.wrapper.chart_last_request import ChartLastRequest
@@ -18,33 +23,167 @@ class ExpertAdvisorSettings:
     period: int
     scenario_name: str
     run_at: datetime
+    # keeps the candles on disk, so only the ones since the last run are downloaded
+    candle_store_dir: str = None
+    # lower period whose candles the ones of the period are built from, so scenarios on several periods share a download;
+    # takes a candle store with the base period backfilled, the period is downloaded itself otherwise
+    base_period: int = None
 
 
 class ExpertAdvisor:
     def __init__(self, settings: ExpertAdvisorSettings):
         self.settings = settings
+        self._client_lock = threading.Lock()
+
+    def get_download_period(self) -> int:
+        # only periods made of whole base candles and dividing a day line up with the broker candles
+        base_period = self.settings.base_period
+        period = self.settings.period
+        is_derived = self.settings.candle_store_dir is not None \
+            and base_period is not None and base_period < period and period % base_period == 0 and 1440 % period == 0
+
+        return base_period if is_derived else period
+
+    def is_non_closed_candle(self, candle_open: int, current_run_time: datetime, period: int) -> bool:
+        current_candle_end = candle_open + period * 60 * 1000
+        current_run_at = current_run_time.timestamp() * 1000
+
+        return candle_open < current_run_at < current_candle_end
+
+    def process_non_closed_candle(self, candles: CandleFrame, current_run_time: datetime) -> CandleFrame:
+        is_non_closed = self.is_non_closed_candle(int(candles.timestamp[-1]), current_run_time, self.settings.period)
+
+        return candles[:-1] if is_non_closed else candles
+
+    def get_chart_last_request(self, period: int, start: int) -> dict:
+        command_arguments = {"info": {"period": period, "start": start, "symbol": self.settings.symbol}}
+        get_chart_last_request_resp = self.settings.client.commandExecute("getChartLastRequest", command_arguments)
 
-    def process_non_closed_candle(self, dataframe: DataFrame, current_run_time: datetime) -> DataFrame:
-        current_candle_open = dataframe.iloc[-1]['date_time']
-        tz_current_candle_open = current_candle_open.tz_localize(tz='Europe/Warsaw')
-        dt_current_candle_open = tz_current_candle_open.to_pydatetime(current_candle_open)
-        dt_current_candle_end = dt_current_candle_open + timedelta(minutes=self.settings.period)
+        return get_chart_last_request_resp['returnData']
 
-        return dataframe.iloc[:-1] if dt_current_candle_open < current_run_time < dt_current_candle_end else dataframe
+    @staticmethod
+    def get_rate_infos_candles(chart_data: dict) -> dict:
+        # open comes multiplied by 10^digits, close/high/low are offsets from it
+        digits = chart_data['digits']
+        rate_infos = chart_data['rateInfos']
+        opens = np.array([rate_info['open'] for rate_info in rate_infos], dtype=float)
 
-    def initial_processing(self, dataframe: DataFrame, drop_non_closed_candle: bool) -> DataFrame:
-        dataframe['date_time'] = dataframe["timestamp"].map(lambda value: datetime.fromtimestamp(int(value)))
-        result = self.process_non_closed_candle(dataframe, self.settings.run_at) if drop_non_closed_candle else dataframe
+        def get_prices(offsets: list):
+            return ((opens + np.array(offsets, dtype=float)) / 10 ** digits).round(digits)
 
-        return result[['date_time', 'open', 'close', 'high', 'low', 'volume']]
+        return dict(
+            timestamp=np.array([rate_info['ctm'] for rate_info in rate_infos], dtype=np.int64),
+            open=(opens / 10 ** digits).round(digits),
+            close=get_prices([rate_info['close'] for rate_info in rate_infos]),
+            high=get_prices([rate_info['high'] for rate_info in rate_infos]),
+            low=get_prices([rate_info['low'] for rate_info in rate_infos]),
+            volume=np.array([rate_info['vol'] for rate_info in rate_infos], dtype=float)
+        )
 
-    def from_api(self, drop_non_closed_candle: bool = True) -> DataFrame:
+    def get_raw_candles(self, period: int) -> dict:
         raw_data = ChartLastRequest(self.settings.client)\
-            .request_candle_history_with_limit(self.settings.symbol, self.settings.period)
+            .request_candle_history_with_limit(self.settings.symbol, period)
 
         raw_dataframe = DataFrame(raw_data)
+        candles = {column: raw_dataframe[column].to_numpy() for column in CandleStore.columns}
+        # the wrapper gives seconds, candles are kept in epoch milliseconds as the API sends them
+        candles['timestamp'] = raw_dataframe['timestamp'].to_numpy(dtype=np.int64) * 1000
 
-        return self.initial_processing(raw_dataframe, drop_non_closed_candle)
+        return candles
+
+    @staticmethod
+    def read_candle_store(store: CandleStore, history_factor: int) -> dict:
+        # a derived period gets as many candles as the broker window of the base one holds, with the base candles
+        # of a bucket the history may start within; None when the store does not reach that far back
+        limit = (store.load_meta()['history_size'] + 1) * history_factor - 1
+
+        if store.get_count() < limit:
+            return None
+
+        # copied while the lock is held, a later write truncates the tail of the mapped files
+        return {column: np.array(values) for column, values in store.read(limit=limit).items()}
+
+    def from_candle_store(self, period: int, is_non_closed_candle_used: bool, history_factor: int = 1) -> dict:
+        store = CandleStore(self.settings.candle_store_dir, self.settings.symbol, period)
+        with store.lock():
+            meta = store.load_meta()
+            last_timestamp = store.get_last_timestamp() if meta is not None else None
+            is_history_known = meta is not None and 'history_size' in meta
+
+            # the closed candles stored are as recent as the broker has until the last one closes, scenarios dropping
+            # the non-closed one share one download per candle close; the others share the one of the same run minute
+            run_minute = int(self.settings.run_at.timestamp()) // 60 * 60 * 1000
+            is_stored = is_history_known and last_timestamp is not None \
+                and self.is_non_closed_candle(last_timestamp, self.settings.run_at, period)
+            if is_stored and (not is_non_closed_candle_used or meta.get('updated_at') == run_minute):
+                logger.info(f'Using candles stored since the close at {last_timestamp}')
+                return self.read_candle_store(store, history_factor)
+
+            is_updated = False
+            if last_timestamp is not None:
+                # one candle back, so the response overlaps the stored ones whether the start is included or not
+                candles = self.get_rate_infos_candles(self.get_chart_last_request(period, last_timestamp - period * 60 * 1000))
+                is_updated = len(candles['timestamp']) != 0 and candles['timestamp'][0] <= last_timestamp
+                if is_updated:
+                    store.write(candles, updated_at=run_minute)
+
+            if not is_updated or not is_history_known:
+                # nothing stored yet, the stored candles do not reach the current ones or they were only backfilled,
+                # the whole history is downloaded for its size; older candles are kept in front of it
+                candles = self.get_raw_candles(period)
+                store.write(candles, history_size=len(candles['timestamp']), updated_at=run_minute)
+
+            return self.read_candle_store(store, history_factor)
+
+    def get_bucket_offset(self, store: CandleStore) -> int:
+        # where within a period since the epoch the broker opens the candles of the period, learnt from its own candles
+        # once per base store; None when they do not share one
+        meta = store.load_meta()
+        bucket_offsets = meta.get('bucket_offsets', dict())
+        period_key = str(self.settings.period)
+        if period_key not in bucket_offsets:
+            period_ms = self.settings.period * 60 * 1000
+            week_ago = int(self.settings.run_at.timestamp() * 1000) - 7 * 24 * 60 * 60 * 1000
+            timestamps = self.get_rate_infos_candles(self.get_chart_last_request(self.settings.period, week_ago))['timestamp']
+            offsets = set((timestamps % period_ms).tolist())
+            if len(offsets) == 0:
+                return None
+
+            bucket_offsets[period_key] = offsets.pop() if len(offsets) == 1 else None
+            meta['bucket_offsets'] = bucket_offsets
+            store.save_meta(meta)
+
+        return bucket_offsets[period_key]
+
+    def get_derived_candles(self, base_period: int, drop_non_closed_candle: bool, dtype) -> CandleFrame:
+        columns = self.from_candle_store(base_period, not drop_non_closed_candle, self.settings.period // base_period)
+        if columns is None:
+            logger.warning(f'{self.settings.symbol} candles of period {base_period} do not cover the history of period '
+                           f'{self.settings.period}, backfill the candle store; downloading period {self.settings.period}')
+            return None
+
+        store = CandleStore(self.settings.candle_store_dir, self.settings.symbol, base_period)
+        with store.lock():
+            bucket_offset = self.get_bucket_offset(store)
+        if bucket_offset is None:
+            logger.warning(f'{self.settings.symbol} candles of period {self.settings.period} do not open at a fixed offset, '
+                           f'downloading period {self.settings.period}')
+            return None
+
+        return CandleFrame.from_columns(columns, dtype).resample(self.settings.period, bucket_offset)
+
+    def from_api(self, drop_non_closed_candle: bool = True, dtype=np.float64) -> CandleFrame:
+        download_period = self.get_download_period()
+        candles = self.get_derived_candles(download_period, drop_non_closed_candle, dtype) \
+            if download_period != self.settings.period \
+            else None
+        if candles is None:
+            columns = self.from_candle_store(self.settings.period, not drop_non_closed_candle) \
+                if self.settings.candle_store_dir is not None \
+                else self.get_raw_candles(self.settings.period)
+            candles = CandleFrame.from_columns(columns, dtype)
+
+        return self.process_non_closed_candle(candles, self.settings.run_at) if drop_non_closed_candle else candles
 
     @staticmethod
     def get_current_trade_market(cmd: int):
@@ -73,19 +212,36 @@ class ExpertAdvisor:
 
         return trade_transaction_resp["returnData"]
 
-    @retry(TransactionStatusException)
-    def check_order_status(self, order: OrderWrapper, open_order_callable) -> dict:
-        order_resp = open_order_callable(order)
-        order_number = order_resp['order']
+    async def execute_on_client(self, function, *args):
+        # the client connection takes one request at a time, so requests still go one by one - running them aside
+        # only keeps the event loop free for the waits of the other orders meanwhile
+        def execute_locked():
+            with self._client_lock:
+                return function(*args)
 
+        return await asyncio.to_thread(execute_locked)
+
+    @async_retry(TransactionPendingException)
+    async def get_order_status(self, order_number: int) -> dict:
         command_arguments = {"order": order_number}
-        trade_transaction_status_resp = self.settings.client.commandExecute("tradeTransactionStatus", command_arguments)
+        trade_transaction_status_resp = await self.execute_on_client(
+            self.settings.client.commandExecute, "tradeTransactionStatus", command_arguments
+        )
         request_status = trade_transaction_status_resp['returnData']['requestStatus']
+        if request_status == 1:
+            raise TransactionPendingException(f'Order {order_number} is pending')
         if request_status != 3:
             raise TransactionStatusException(trade_transaction_status_resp['returnData']['message'])
 
         return trade_transaction_status_resp
 
+    @async_retry(TransactionStatusException, retries=3)
+    async def check_order_status(self, order: OrderWrapper, open_order_callable) -> dict:
+        # a rejected order is sent again, a pending one is only polled so it is never sent twice
+        order_resp = await self.execute_on_client(open_order_callable, order)
+
+        return await self.get_order_status(order_resp['order'])
+
     def get_trades(self, opened_only: bool = True) -> list[dict]:
         command_arguments = {"openedOnly": opened_only}
         get_trades_resp = self.settings.client.commandExecute("getTrades", command_arguments)
@@ -98,7 +254,18 @@ class ExpertAdvisor:
         return list((item for item in trades if item["customComment"] == scenario_name))
 
     def open_order_on_signal(self, order: OrderWrapper, open_order_callable) -> dict:
-        return self.check_order_status(order, open_order_callable)
+        return asyncio.run(self.check_order_status(order, open_order_callable))
+
+    def open_orders_on_signal(self, orders: list[OrderWrapper], open_order_callable) -> list:
+        # every order is sent and confirmed on its own, a failed one does not stop the others; it is returned as its
+        # exception, so the caller decides what the failure means for the orders already sent
+        async def check_orders_status():
+            return await asyncio.gather(
+                *[self.check_order_status(order, open_order_callable) for order in orders],
+                return_exceptions=True
+            )
+
+        return asyncio.run(check_orders_status())
 
     def modifyPosition(self, order: OrderWrapper) -> dict:
         return self.execute_tradeTransaction(order)
@@ -0,0 +1,17 @@
+import threading
+import time
+
+
+class RateLimiter:
+    # spaces the calls of every thread sharing it at least interval seconds apart
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.next_call_at = 0.0
+
+    def wait(self):
+        with self.lock:
+            call_at = max(self.next_call_at, time.monotonic())
+            self.next_call_at = call_at + self.interval
+
+        time.sleep(max(call_at - time.monotonic(), 0))
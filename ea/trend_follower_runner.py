@@ -28,6 +28,7 @@ class EARunnerSettings:
     stop_loss_factor: float
     take_profit_factor: float
     run_at: datetime
+    checkpoint_dir: str = None
 
 
 class EARunner:
@@ -43,6 +44,9 @@ class EARunner:
                f'stop_loss_factor:{self._settings.stop_loss_factor}-' \
                f'take_profit_factor:{self._settings.take_profit_factor}-'
 
+    def get_checkpoint_path(self, scenario_name: str, name: str) -> str:
+        return os.path.join(self._settings.checkpoint_dir, f'{scenario_name}-{name}.pickle')
+
     def get_price(self, price_value, precision):
         price = round(price_value, precision)
 
@@ -149,12 +153,16 @@ class EARunner:
             symbol=self._settings.symbol,
             period=self._settings.period,
             scenario_name=scenario_name,
-            run_at=self._settings.run_at
+            run_at=self._settings.run_at,
+            candle_store_dir=os.getenv('EA_CANDLE_STORE_DIR'),
+            base_period=int(os.environ['EA_BASE_PERIOD']) if 'EA_BASE_PERIOD' in os.environ else None
         )
         ea = ExpertAdvisor(ea_settings)
 
         raw_df = ea.from_api()
-        analyzed_df = strategy.analyze(raw_df)
+        analyzed_df = strategy.analyze_incremental(raw_df, self.get_checkpoint_path(scenario_name, 'trend_follower')) \
+            if self._settings.checkpoint_dir is not None \
+            else strategy.analyze(raw_df)
 
         # How far from last extreme
         current_extreme_index = analyzed_df.groupby('current_extreme_on')['current_extreme_on'].idxmin()[-1]
@@ -311,6 +319,7 @@ if __name__ == "__main__":
     parser.add_argument('-rw', '--rolling_window', type=int, required=True)
     parser.add_argument('-slf', '--stop_loss_factor', type=float, required=True)
     parser.add_argument('-tpf', '--take_profit_factor', type=float, required=True)
+    parser.add_argument('-cd', '--checkpoint_dir', type=str, required=False, default=None)
 
     args = parser.parse_args()
     user_id = os.getenv('XTB_API_USER')
@@ -322,6 +331,7 @@ if __name__ == "__main__":
     rolling_window = args.rolling_window
     stop_loss_factor = args.stop_loss_factor
     take_profit_factor = args.take_profit_factor
+    checkpoint_dir = args.checkpoint_dir
 
     client = APIClient()
     loginResponse = client.execute(loginCommand(userId=user_id, password=password))
@@ -340,7 +350,8 @@ if __name__ == "__main__":
             rolling_window,
             stop_loss_factor,
             take_profit_factor,
-            run_at
+            run_at,
+            checkpoint_dir
         )
         EARunner(ea_runner_settings).start()
 
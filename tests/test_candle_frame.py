@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from ea.misc.candle_frame import CandleFrame
+
+
+def get_candles(count: int, period: int, start: int) -> CandleFrame:
+    rng = np.random.default_rng(0)
+    # a few candles are missing, as they are on a quiet market
+    timestamp = start + np.flatnonzero(rng.random(count) > 0.05) * period * 60 * 1000
+    opens = 1.1 + np.cumsum(rng.normal(0, 1e-4, len(timestamp)))
+    closes = opens + rng.normal(0, 1e-4, len(timestamp))
+
+    return CandleFrame.from_columns(dict(
+        timestamp=timestamp,
+        open=opens,
+        close=closes,
+        high=np.maximum(opens, closes) + np.abs(rng.normal(0, 1e-4, len(timestamp))),
+        low=np.minimum(opens, closes) - np.abs(rng.normal(0, 1e-4, len(timestamp))),
+        volume=rng.integers(1, 100, len(timestamp)).astype(float)
+    ))
+
+
+def to_indexed_frame(candles: CandleFrame) -> pd.DataFrame:
+    return pd.DataFrame(
+        dict(open=candles.open, close=candles.close, high=candles.high, low=candles.low, volume=candles.volume),
+        index=pd.to_datetime(candles.timestamp, unit='ms')
+    )
+
+
+@pytest.mark.parametrize('period, bucket_offset', [(15, 0), (60, 0), (240, 0), (240, 60 * 60 * 1000), (1440, 0)])
+def test_resample_matches_broker_buckets(period: int, bucket_offset: int):
+    # starts within a bucket, which is left out
+    candles = get_candles(5000, 5, 1_700_000_000_000 - 1_700_000_000_000 % 300_000 + 35 * 60 * 1000)
+    resampled = candles.resample(period, bucket_offset)
+
+    frame = to_indexed_frame(candles)
+    expected = frame.resample(f'{period}min', origin='epoch', offset=pd.Timedelta(milliseconds=bucket_offset)) \
+        .agg(dict(open='first', close='last', high='max', low='min', volume='sum')) \
+        .dropna()
+    first_bucket_open = expected.index[0].value // 10 ** 6
+    if first_bucket_open != candles.timestamp[0]:
+        expected = expected.iloc[1:]
+
+    assert np.array_equal(resampled.timestamp, expected.index.as_unit('ms').asi8)
+    for column in ['open', 'close', 'high', 'low', 'volume']:
+        assert np.allclose(getattr(resampled, column), expected[column])
+    assert np.all((resampled.timestamp - bucket_offset) % (period * 60 * 1000) == 0)
+
+
+def test_resample_without_whole_bucket():
+    candles = get_candles(3, 5, 1_700_000_000_000 - 1_700_000_000_000 % 300_000 + 5 * 60 * 1000)
+
+    assert len(candles.resample(60)) == 0
+    assert len(candles[:0].resample(60)) == 0
+
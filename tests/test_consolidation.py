@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from ea.misc.checkpoint import load_checkpoint
+from ea.strategies.indicators.consolidation import Consolidation
+from ea.strategies.indicators.waves import Waves
+
+HISTORY_SIZE = 300
+
+
+def get_candles(count: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    closes = np.round(1.1 + np.cumsum(rng.normal(0, 3e-4, count)), 5)
+    opens = np.r_[closes[0], closes[:-1]]
+
+    return pd.DataFrame(dict(
+        date_time=pd.date_range('2023-01-02', periods=count, freq='min'),
+        open=opens,
+        close=closes,
+        high=np.round(np.maximum(opens, closes) + np.abs(rng.normal(0, 2e-4, count)), 5),
+        low=np.round(np.minimum(opens, closes) - np.abs(rng.normal(0, 2e-4, count)), 5),
+        volume=rng.integers(1, 100, count).astype(float)
+    ))
+
+
+def without_pending_breaks(dataframe: pd.DataFrame) -> pd.DataFrame:
+    # candles without a break are marked with the time of the run
+    local_df = dataframe.copy()
+    for column in ['consolidation_break_at', 'open_position_at']:
+        local_df[column] = local_df[column].where(local_df[column] < pd.Timestamp('2024-01-01'))
+
+    return local_df
+
+
+@pytest.mark.parametrize('quantile_estimator, quantile_window', [(None, None), ('exact', 40), ('p2', None)])
+def test_incremental_matches_analyze(tmp_path, quantile_estimator: str, quantile_window: int):
+    waves_df = Waves(dict(distance=0.001)).analyze(get_candles(1000, 0))
+    settings = dict(
+        allowed_wave_percent_change=10,
+        waves_height_quantile=0.5,
+        minimum_waves_count=3,
+        quantile_estimator=quantile_estimator,
+        quantile_window=quantile_window
+    )
+    consolidation = Consolidation(settings)
+
+    rng = np.random.default_rng(0)
+    history_end = HISTORY_SIZE
+    while history_end < len(waves_df):
+        history_df = waves_df.iloc[history_end - HISTORY_SIZE:history_end].reset_index(drop=True)
+        analyzed_df = consolidation.analyze_incremental(history_df, str(tmp_path / 'consolidation.pickle'))
+
+        # everything since the checkpoint origin, restricted to the current history - the history itself without an estimator
+        expected_df = consolidation.analyze(waves_df.iloc[:history_end].copy()) \
+            if quantile_estimator is not None \
+            else consolidation.analyze(history_df.copy())
+        expected_df = expected_df[expected_df['date_time'] >= history_df['date_time'].iloc[0]].reset_index(drop=True)
+        pd.testing.assert_frame_equal(without_pending_breaks(analyzed_df), without_pending_breaks(expected_df))
+
+        history_end += int(rng.integers(1, 8))
+
+
+def test_incremental_state_is_bounded(tmp_path):
+    waves_df = Waves(dict(distance=0.001)).analyze(get_candles(2000, 1))
+    consolidation = Consolidation(dict(allowed_wave_percent_change=10, waves_height_quantile=0.5, minimum_waves_count=3, quantile_estimator='p2'))
+    checkpoint_path = str(tmp_path / 'consolidation.pickle')
+
+    retained_candles = []
+    for history_end in range(HISTORY_SIZE, len(waves_df), 5):
+        consolidation.analyze_incremental(waves_df.iloc[history_end - HISTORY_SIZE:history_end].reset_index(drop=True), checkpoint_path)
+        retained_candles.append(len(load_checkpoint(checkpoint_path).candles))
+
+    assert max(retained_candles) < 2 * HISTORY_SIZE
@@ -0,0 +1,138 @@
+import sys
+from datetime import timezone
+from types import ModuleType
+
+import numpy as np
+import pandas as pd
+import pytest
+
+try:
+    import xtb.wrapper.xtb_client  # noqa: F401
+except ImportError:
+    # the broker is faked below, the wrapper only has to provide the names the expert advisor imports
+    for name, attributes in {
+        'xtb': dict(),
+        'xtb.wrapper': dict(),
+        'xtb.wrapper.chart_last_request': dict(ChartLastRequest=None),
+        'xtb.wrapper.xtb_client': dict(APIClient=None)
+    }.items():
+        sys.modules[name] = ModuleType(name)
+        sys.modules[name].__dict__.update(attributes)
+
+from ea.trading.candle_store import CandleStore  # noqa: E402
+from ea.trading.expert_advisor import ExpertAdvisor, ExpertAdvisorSettings  # noqa: E402
+
+DIGITS = 5
+# the broker opens H4 candles an hour after the multiples of 4 hours since the epoch
+BUCKET_OFFSETS = {240: pd.Timedelta(hours=1)}
+HISTORY_SIZES = {5: 100, 60: 400, 240: 300}
+
+
+class Broker:
+    def __init__(self, now: pd.Timestamp):
+        rng = np.random.default_rng(0)
+        minutes = 60 * 24 * 30
+        timestamps = now.floor('D').value // 10 ** 6 - minutes * 60 * 1000 + np.arange(minutes) * 60 * 1000
+        timestamps = timestamps[rng.random(minutes) > 0.05]
+        opens = np.round(1.1 + np.cumsum(rng.normal(0, 1e-4, len(timestamps))), DIGITS)
+        closes = np.round(opens + rng.normal(0, 1e-4, len(timestamps)), DIGITS)
+        self.candles = pd.DataFrame(
+            dict(
+                open=opens,
+                close=closes,
+                high=np.round(np.maximum(opens, closes) + np.abs(rng.normal(0, 1e-4, len(timestamps))), DIGITS),
+                low=np.round(np.minimum(opens, closes) - np.abs(rng.normal(0, 1e-4, len(timestamps))), DIGITS),
+                volume=rng.integers(1, 10, len(timestamps)).astype(float)
+            ),
+            index=pd.to_datetime(timestamps, unit='ms')
+        )
+        self.now = now
+        self.requests = []
+
+    def get_candles(self, period: int) -> pd.DataFrame:
+        return self.candles[self.candles.index < self.now] \
+            .resample(f'{period}min', origin='epoch', offset=BUCKET_OFFSETS.get(period)) \
+            .agg(dict(open='first', close='last', high='max', low='min', volume='sum')) \
+            .dropna()
+
+    def history(self, symbol: str, period: int) -> list[dict]:
+        self.requests.append(('history', period))
+        candles = self.get_candles(period).iloc[-HISTORY_SIZES[period]:]
+
+        return [
+            dict(timestamp=timestamp.value // 10 ** 9, open=row.open, close=row.close, high=row.high, low=row.low, volume=row.volume)
+            for timestamp, row in candles.iterrows()
+        ]
+
+    def commandExecute(self, command: str, arguments: dict) -> dict:
+        period = arguments['info']['period']
+        self.requests.append((command, period))
+        candles = self.get_candles(period)
+        candles = candles[candles.index >= pd.Timestamp(arguments['info']['start'], unit='ms')]
+        scale = 10 ** DIGITS
+        rate_infos = [
+            dict(
+                ctm=timestamp.value // 10 ** 6,
+                open=round(row.open * scale),
+                close=round((row.close - row.open) * scale),
+                high=round((row.high - row.open) * scale),
+                low=round((row.low - row.open) * scale),
+                vol=row.volume
+            )
+            for timestamp, row in candles.iterrows()
+        ]
+
+        return dict(returnData=dict(digits=DIGITS, rateInfos=rate_infos))
+
+
+class ChartLastRequest:
+    def __init__(self, client: Broker):
+        self.client = client
+
+    def request_candle_history_with_limit(self, symbol: str, period: int) -> list[dict]:
+        return self.client.history(symbol, period)
+
+
+@pytest.fixture
+def broker(monkeypatch) -> Broker:
+    monkeypatch.setattr('ea.trading.expert_advisor.ChartLastRequest', ChartLastRequest)
+
+    return Broker(pd.Timestamp('2023-11-15 13:47:20'))
+
+
+def get_expert_advisor(broker: Broker, period: int, candle_store_dir: str = None, base_period: int = None) -> ExpertAdvisor:
+    run_at = broker.now.tz_localize(timezone.utc).to_pydatetime()
+
+    return ExpertAdvisor(ExpertAdvisorSettings(broker, 'EURUSD', period, 'scenario', run_at, candle_store_dir, base_period))
+
+
+def assert_same_candles(candles, expected):
+    assert np.array_equal(candles.timestamp, expected.timestamp)
+    for column in ['open', 'close', 'high', 'low', 'volume']:
+        assert np.allclose(getattr(candles, column), getattr(expected, column))
+
+
+@pytest.mark.parametrize('period', [60, 240])
+@pytest.mark.parametrize('drop_non_closed_candle', [True, False])
+def test_derived_candles_match_broker_ones(broker: Broker, tmp_path, period: int, drop_non_closed_candle: bool):
+    base_candles = broker.get_candles(5)
+    CandleStore(str(tmp_path), 'EURUSD', 5).merge(dict(
+        timestamp=base_candles.index.as_unit('ms').asi8,
+        **{column: base_candles[column].to_numpy() for column in ['open', 'close', 'high', 'low', 'volume']}
+    ))
+
+    derived = get_expert_advisor(broker, period, str(tmp_path), 5).from_api(drop_non_closed_candle)
+    assert ('history', period) not in broker.requests
+
+    expected = get_expert_advisor(broker, period).from_api(drop_non_closed_candle)
+    # at least as many candles as the broker window of the base period holds, but the non-closed one
+    assert len(derived) >= HISTORY_SIZES[5] - 1
+    assert_same_candles(derived, expected[len(expected) - len(derived):])
+    assert np.all((derived.timestamp - BUCKET_OFFSETS.get(period, pd.Timedelta(0)).value // 10 ** 6) % (period * 60 * 1000) == 0)
+
+
+def test_short_base_history_falls_back_to_broker_candles(broker: Broker, tmp_path):
+    candles = get_expert_advisor(broker, 240, str(tmp_path), 5).from_api()
+
+    assert ('history', 240) in broker.requests
+    assert_same_candles(candles, get_expert_advisor(broker, 240).from_api())
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from ea.strategies.indicators.quantile import ExactQuantile, P2Quantile, get_running_quantiles
+
+
+@pytest.mark.parametrize('quantile', [0.0, 0.3, 0.5, 0.9, 1.0])
+def test_exact_quantile_matches_numpy(quantile: float):
+    values = np.random.default_rng(0).exponential(1e-3, 500).tolist()
+    running_quantiles = get_running_quantiles(ExactQuantile(quantile), values)
+
+    expected = [np.quantile(values[:idx + 1], quantile) for idx in range(len(values))]
+    assert np.array_equal(running_quantiles, expected)
+
+
+@pytest.mark.parametrize('window', [1, 7, 40])
+def test_rolling_exact_quantile_matches_numpy(window: int):
+    # repeated values are removed from the window one at a time
+    values = np.round(np.random.default_rng(1).exponential(1e-3, 500), 4).tolist()
+    running_quantiles = get_running_quantiles(ExactQuantile(0.7, window), values)
+
+    expected = [np.quantile(values[max(idx + 1 - window, 0):idx + 1], 0.7) for idx in range(len(values))]
+    assert np.array_equal(running_quantiles, expected)
+
+
+def test_p2_quantile_follows_numpy():
+    values = np.random.default_rng(2).exponential(1e-3, 5000).tolist()
+    running_quantiles = get_running_quantiles(P2Quantile(0.5), values)
+
+    assert np.array_equal(running_quantiles[:5], [np.quantile(values[:idx + 1], 0.5) for idx in range(5)])
+    assert running_quantiles[-1] == pytest.approx(np.quantile(values, 0.5), rel=0.05)
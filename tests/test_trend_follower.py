@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from ea.misc.checkpoint import load_checkpoint
+from ea.strategies.indicators.trend_follower import TrendFollower
+
+HISTORY_SIZE = 300
+
+
+def get_candles(count: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    closes = np.round(1.1 + np.cumsum(rng.normal(0, 3e-4, count)), 5)
+    opens = np.r_[closes[0], closes[:-1]]
+
+    return pd.DataFrame(dict(
+        date_time=pd.date_range('2023-01-02', periods=count, freq='min'),
+        open=opens,
+        close=closes,
+        high=np.round(np.maximum(opens, closes) + np.abs(rng.normal(0, 2e-4, count)), 5),
+        low=np.round(np.minimum(opens, closes) - np.abs(rng.normal(0, 2e-4, count)), 5),
+        volume=rng.integers(1, 100, count).astype(float)
+    ))
+
+
+@pytest.mark.parametrize('extreme_candles_range, beta_extreme_count, rolling_window', [(3, 3, 10), (10, 5, 20), (1, 2, 1)])
+def test_incremental_matches_analyze(tmp_path, extreme_candles_range: int, beta_extreme_count: int, rolling_window: int):
+    candles_df = get_candles(900, 0)
+    trend_follower = TrendFollower(dict(
+        extreme_candles_range=extreme_candles_range,
+        beta_extreme_count=beta_extreme_count,
+        rolling_window=rolling_window
+    ))
+    checkpoint_path = str(tmp_path / 'trend_follower.pickle')
+
+    rng = np.random.default_rng(0)
+    history_end = HISTORY_SIZE // 2
+    while history_end < len(candles_df):
+        full_history_df = candles_df.iloc[:history_end].copy()
+        # the most recent candle is not closed yet
+        full_history_df.iloc[-1, full_history_df.columns.get_indexer(['low', 'high'])] += [-rng.random() * 2e-3, rng.random() * 2e-3]
+        history_df = full_history_df.iloc[max(history_end - HISTORY_SIZE, 0):]
+        analyzed_df = trend_follower.analyze_incremental(history_df, checkpoint_path)
+
+        # everything since the checkpoint origin, restricted to the current history
+        pd.testing.assert_frame_equal(analyzed_df, trend_follower.analyze(full_history_df).loc[history_df.index])
+        assert len(load_checkpoint(checkpoint_path).rolling_n_lows) <= HISTORY_SIZE
+
+        history_end += int(rng.integers(1, 12))
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from ea.strategies.indicators.waves import Waves
+
+HISTORY_SIZE = 300
+
+
+def get_candles(count: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    closes = np.round(1.1 + np.cumsum(rng.normal(0, 3e-4, count)), 5)
+    opens = np.r_[closes[0], closes[:-1]]
+
+    return pd.DataFrame(dict(
+        date_time=pd.date_range('2023-01-02', periods=count, freq='min'),
+        open=opens,
+        close=closes,
+        high=np.round(np.maximum(opens, closes) + np.abs(rng.normal(0, 2e-4, count)), 5),
+        low=np.round(np.minimum(opens, closes) - np.abs(rng.normal(0, 2e-4, count)), 5),
+        volume=rng.integers(1, 100, count).astype(float)
+    ))
+
+
+@pytest.mark.parametrize('distance', [0.0005, 0.002])
+def test_incremental_matches_analyze(tmp_path, distance: float):
+    candles_df = get_candles(900, 0)
+    waves = Waves(dict(distance=distance))
+
+    rng = np.random.default_rng(0)
+    history_end = 1
+    while history_end < len(candles_df):
+        history_df = candles_df.iloc[max(history_end - HISTORY_SIZE, 0):history_end + 1].reset_index(drop=True)
+        # the most recent candle is not closed yet
+        history_df.loc[len(history_df) - 1, ['close', 'high']] = history_df['open'].iloc[-1]
+        analyzed_df = waves.analyze_incremental(history_df, str(tmp_path / 'waves.pickle'))
+
+        # everything since the checkpoint origin, restricted to the current history
+        full_history_df = pd.concat([candles_df.iloc[:max(history_end - HISTORY_SIZE, 0)], history_df], ignore_index=True)
+        expected_df = waves.analyze(full_history_df)
+        if expected_df is None:
+            assert analyzed_df is None
+        else:
+            pd.testing.assert_frame_equal(analyzed_df, expected_df.iloc[len(full_history_df) - len(history_df):].reset_index(drop=True))
+
+        history_end += int(rng.integers(1, 12))